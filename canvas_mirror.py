@@ -0,0 +1,524 @@
+"""
+Local SQLite mirror of a course's assignments, submissions, comments and group memberships.
+
+`sync` crawls Canvas incrementally (reusing the notifier's assignment pruning) and
+`query` answers comment lookups locally. `main.py`, `main_all.py` and
+`notify_course_comments.py` can read from the mirror with `--source=mirror`.
+"""
+
+from canvasapi import Canvas
+from canvasapi.exceptions import ResourceDoesNotExist
+import argparse
+from datetime import datetime, timezone
+import os
+from pathlib import Path
+import sqlite3
+import sys
+import time
+from types import SimpleNamespace
+
+import notify_course_comments as notifier
+
+sys.stdout.reconfigure(line_buffering=True)
+
+DEFAULT_MIRROR_FILE = "canvas_mirror.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS courses (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    synced_at TEXT
+);
+CREATE TABLE IF NOT EXISTS assignments (
+    id INTEGER PRIMARY KEY,
+    course_id INTEGER NOT NULL,
+    name TEXT,
+    html_url TEXT,
+    published INTEGER,
+    has_submitted_submissions INTEGER,
+    needs_grading_count INTEGER,
+    updated_at TEXT,
+    due_at TEXT,
+    lock_at TEXT,
+    crawled_updated_at TEXT,
+    last_activity TEXT,
+    synced_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_assignments_course ON assignments (course_id);
+CREATE TABLE IF NOT EXISTS submissions (
+    assignment_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    id INTEGER,
+    user_name TEXT,
+    PRIMARY KEY (assignment_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS idx_submissions_id ON submissions (id);
+CREATE TABLE IF NOT EXISTS comments (
+    key TEXT PRIMARY KEY,
+    course_id INTEGER,
+    assignment_id INTEGER NOT NULL,
+    submission_user_id INTEGER,
+    comment_id INTEGER,
+    author_id INTEGER,
+    author_name TEXT,
+    created_at TEXT,
+    comment TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_comments_thread ON comments (assignment_id, submission_user_id);
+CREATE INDEX IF NOT EXISTS idx_comments_author ON comments (author_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_comments_created ON comments (created_at);
+CREATE TABLE IF NOT EXISTS group_members (
+    user_id TEXT PRIMARY KEY,
+    group_name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_group_members_group ON group_members (group_name);
+"""
+
+
+def connect_mirror(mirror_file: str) -> sqlite3.Connection:
+    path = Path(mirror_file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def get_meta(conn: sqlite3.Connection, key: str) -> str | None:
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row["value"] if row else None
+
+
+def set_meta(conn: sqlite3.Connection, key: str, value: str | None) -> None:
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+def sync_groups(conn: sqlite3.Connection, group_map: dict[str, str]) -> None:
+    with conn:
+        conn.execute("DELETE FROM group_members")
+        conn.executemany(
+            "INSERT INTO group_members (user_id, group_name) VALUES (?, ?)",
+            sorted(group_map.items()),
+        )
+
+
+def assignment_records(conn: sqlite3.Connection, course_id: int) -> dict[str, dict]:
+    """Activity records in the shape `notifier.prune_assignments` expects."""
+    rows = conn.execute(
+        "SELECT id, crawled_updated_at, last_activity FROM assignments "
+        "WHERE course_id = ? AND synced_at IS NOT NULL",
+        (course_id,),
+    )
+    return {
+        str(row["id"]): {"last_activity": row["last_activity"], "updated_at": row["crawled_updated_at"]}
+        for row in rows
+    }
+
+
+def _optional_bool(value) -> int | None:
+    return None if value is None else int(bool(value))
+
+
+def upsert_assignment(conn: sqlite3.Connection, course_id: int, assignment) -> None:
+    conn.execute(
+        """
+        INSERT INTO assignments (
+            id, course_id, name, html_url, published, has_submitted_submissions,
+            needs_grading_count, updated_at, due_at, lock_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (id) DO UPDATE SET
+            course_id = excluded.course_id,
+            name = excluded.name,
+            html_url = excluded.html_url,
+            published = excluded.published,
+            has_submitted_submissions = excluded.has_submitted_submissions,
+            needs_grading_count = excluded.needs_grading_count,
+            updated_at = excluded.updated_at,
+            due_at = excluded.due_at,
+            lock_at = excluded.lock_at
+        """,
+        (
+            assignment.id,
+            course_id,
+            getattr(assignment, "name", None),
+            getattr(assignment, "html_url", None),
+            _optional_bool(getattr(assignment, "published", None)),
+            _optional_bool(getattr(assignment, "has_submitted_submissions", None)),
+            getattr(assignment, "needs_grading_count", None),
+            getattr(assignment, "updated_at", None),
+            getattr(assignment, "due_at", None),
+            getattr(assignment, "lock_at", None),
+        ),
+    )
+
+
+def replace_assignment_submissions(
+    conn: sqlite3.Connection,
+    course_id: int,
+    assignment,
+    submissions,
+) -> int:
+    """Replace everything stored for one assignment; returns the comment count.
+
+    Replacing the whole assignment (instead of upserting comments) means comments
+    deleted on Canvas disappear from the mirror on the next crawl.
+    """
+    assignment_id = assignment.id
+    submission_rows = []
+    comment_rows = []
+    last_activity = None
+    for submission in submissions:
+        user_id = getattr(submission, "user_id", None)
+        user = getattr(submission, "user", None)
+        if isinstance(user, dict):
+            user_name = user.get("name")
+        else:
+            user_name = getattr(user, "name", None)
+        submission_rows.append((assignment_id, user_id, getattr(submission, "id", None), user_name))
+
+        for comment in getattr(submission, "submission_comments", None) or []:
+            created_at = comment.get("created_at")
+            if created_at and (last_activity is None or created_at > last_activity):
+                last_activity = created_at
+            key = notifier.make_comment_key(course_id, assignment_id, user_id, comment)
+            comment_rows.append(
+                (
+                    key,
+                    course_id,
+                    assignment_id,
+                    user_id,
+                    comment.get("id"),
+                    comment.get("author_id"),
+                    comment.get("author_name"),
+                    created_at,
+                    comment.get("comment") or "",
+                )
+            )
+
+    conn.execute("DELETE FROM comments WHERE assignment_id = ?", (assignment_id,))
+    conn.execute("DELETE FROM submissions WHERE assignment_id = ?", (assignment_id,))
+    conn.executemany(
+        "INSERT OR REPLACE INTO submissions (assignment_id, user_id, id, user_name) VALUES (?, ?, ?, ?)",
+        submission_rows,
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO comments (key, course_id, assignment_id, submission_user_id, comment_id, "
+        "author_id, author_name, created_at, comment) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        comment_rows,
+    )
+    conn.execute(
+        "UPDATE assignments SET crawled_updated_at = ?, last_activity = ?, synced_at = ? WHERE id = ?",
+        (getattr(assignment, "updated_at", None), last_activity, notifier.utc_now_iso(), assignment_id),
+    )
+    return len(comment_rows)
+
+
+def sync_course(
+    conn: sqlite3.Connection,
+    canvas,
+    course_id: int,
+    full_sweep: bool = False,
+    full_sweep_hours: float = notifier.DEFAULT_FULL_SWEEP_HOURS,
+    dormant_days: float = notifier.DEFAULT_DORMANT_DAYS,
+    now: datetime | None = None,
+) -> dict:
+    now = now or datetime.now(timezone.utc)
+    current_user = canvas.get_current_user()
+    course = canvas.get_course(course_id)
+    with conn:
+        set_meta(conn, "current_user_id", str(current_user.id))
+        set_meta(conn, "current_user_name", current_user.name)
+        conn.execute(
+            "INSERT OR REPLACE INTO courses (id, name, synced_at) VALUES (?, ?, ?)",
+            (course.id, course.name, notifier.utc_now_iso()),
+        )
+
+    sweep_key = f"last_full_sweep:{course.id}"
+    full_sweep = full_sweep or notifier.is_full_sweep_due(
+        {"last_full_sweep": get_meta(conn, sweep_key)}, now, full_sweep_hours
+    )
+    records = assignment_records(conn, course.id)
+    assignments = list(course.get_assignments())
+    selected, pruned = notifier.prune_assignments(assignments, records, now, full_sweep, dormant_days)
+
+    with conn:
+        for assignment in assignments:
+            upsert_assignment(conn, course.id, assignment)
+        live_ids = [assignment.id for assignment in assignments]
+        placeholders = ",".join("?" for _ in live_ids) or "NULL"
+        stale_ids = [
+            row["id"]
+            for row in conn.execute(
+                f"SELECT id FROM assignments WHERE course_id = ? AND id NOT IN ({placeholders})",
+                (course.id, *live_ids),
+            )
+        ]
+        for assignment_id in stale_ids:
+            conn.execute("DELETE FROM comments WHERE assignment_id = ?", (assignment_id,))
+            conn.execute("DELETE FROM submissions WHERE assignment_id = ?", (assignment_id,))
+            conn.execute("DELETE FROM assignments WHERE id = ?", (assignment_id,))
+
+    comments = 0
+    for assignment in selected:
+        try:
+            submissions = list(assignment.get_submissions(include=["submission_comments", "user"]))
+        except Exception as exc:
+            print(f"Failed to fetch submissions for assignment {assignment.id}: {exc}")
+            continue
+        with conn:
+            comments += replace_assignment_submissions(conn, course.id, assignment, submissions)
+
+    if full_sweep:
+        with conn:
+            set_meta(conn, sweep_key, notifier.utc_now_iso())
+
+    return {
+        "course_id": course.id,
+        "assignments": len(assignments),
+        "crawled": len(selected),
+        "pruned": pruned,
+        "removed": len(stale_ids),
+        "comments": comments,
+        "full_sweep": full_sweep,
+    }
+
+
+def query_comments(
+    conn: sqlite3.Connection,
+    course_id: int | None = None,
+    assignment_id: int | None = None,
+    author_id: int | None = None,
+    group: str | None = None,
+    since: str | None = None,
+    until: str | None = None,
+    limit: int | None = None,
+) -> list[sqlite3.Row]:
+    clauses = []
+    params: list = []
+    if group is not None:
+        clauses.append(
+            "c.author_id IN (SELECT CAST(user_id AS INTEGER) FROM group_members WHERE group_name = ?)"
+        )
+        params.append(group)
+    if course_id is not None:
+        clauses.append("c.course_id = ?")
+        params.append(course_id)
+    if assignment_id is not None:
+        clauses.append("c.assignment_id = ?")
+        params.append(assignment_id)
+    if author_id is not None:
+        clauses.append("c.author_id = ?")
+        params.append(author_id)
+    if since is not None:
+        clauses.append("c.created_at >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("c.created_at < ?")
+        params.append(until)
+
+    sql = (
+        "SELECT c.*, a.name AS assignment_name, s.user_name AS submission_user_name, g.group_name "
+        "FROM comments AS c "
+        "LEFT JOIN group_members AS g ON g.user_id = CAST(c.author_id AS TEXT) "
+        "LEFT JOIN assignments AS a ON a.id = c.assignment_id "
+        "LEFT JOIN submissions AS s ON s.assignment_id = c.assignment_id AND s.user_id = c.submission_user_id"
+    )
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY c.created_at"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return conn.execute(sql, params).fetchall()
+
+
+class MirrorAssignment:
+    """Read-only stand-in for `canvasapi.assignment.Assignment` backed by the mirror."""
+
+    def __init__(self, conn: sqlite3.Connection, row: sqlite3.Row):
+        self._conn = conn
+        self.id = row["id"]
+        self.course_id = row["course_id"]
+        self.name = row["name"]
+        self.html_url = row["html_url"]
+        self.published = None if row["published"] is None else bool(row["published"])
+        self.has_submitted_submissions = (
+            None if row["has_submitted_submissions"] is None else bool(row["has_submitted_submissions"])
+        )
+        self.needs_grading_count = row["needs_grading_count"]
+        self.updated_at = row["updated_at"]
+        self.due_at = row["due_at"]
+        self.lock_at = row["lock_at"]
+
+    def get_submissions(self, include=None, **kwargs) -> list[SimpleNamespace]:
+        submissions: dict[int, SimpleNamespace] = {}
+        for row in self._conn.execute(
+            "SELECT user_id, id, user_name FROM submissions WHERE assignment_id = ? ORDER BY user_id",
+            (self.id,),
+        ):
+            submissions[row["user_id"]] = SimpleNamespace(
+                id=row["id"],
+                user_id=row["user_id"],
+                assignment_id=self.id,
+                user=SimpleNamespace(id=row["user_id"], name=row["user_name"] or f"Student {row['user_id']}"),
+                submission_comments=[],
+            )
+        for row in self._conn.execute(
+            "SELECT * FROM comments WHERE assignment_id = ? ORDER BY created_at", (self.id,)
+        ):
+            submission = submissions.get(row["submission_user_id"])
+            if submission is None:
+                continue
+            comment = {
+                "author_id": row["author_id"],
+                "author_name": row["author_name"],
+                "created_at": row["created_at"],
+                "comment": row["comment"],
+            }
+            if row["comment_id"] is not None:
+                comment["id"] = row["comment_id"]
+            submission.submission_comments.append(comment)
+        return list(submissions.values())
+
+
+class MirrorCourse:
+    """Read-only stand-in for `canvasapi.course.Course` backed by the mirror."""
+
+    def __init__(self, conn: sqlite3.Connection, row: sqlite3.Row):
+        self._conn = conn
+        self.id = row["id"]
+        self.name = row["name"]
+
+    def get_assignments(self, **kwargs) -> list[MirrorAssignment]:
+        rows = self._conn.execute("SELECT * FROM assignments WHERE course_id = ? ORDER BY id", (self.id,))
+        return [MirrorAssignment(self._conn, row) for row in rows]
+
+    def get_assignment(self, assignment_id, **kwargs) -> MirrorAssignment:
+        row = self._conn.execute(
+            "SELECT * FROM assignments WHERE course_id = ? AND id = ?", (self.id, int(assignment_id))
+        ).fetchone()
+        if row is None:
+            raise ResourceDoesNotExist(f"Assignment {assignment_id} is not in the mirror")
+        return MirrorAssignment(self._conn, row)
+
+
+class MirrorCanvas:
+    """Read-only stand-in for `canvasapi.Canvas` so the scripts can run against the mirror."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+
+    def get_current_user(self) -> SimpleNamespace:
+        user_id = get_meta(self._conn, "current_user_id")
+        return SimpleNamespace(
+            id=int(user_id) if user_id else None,
+            name=get_meta(self._conn, "current_user_name") or "Unknown user",
+        )
+
+    def get_courses(self, **kwargs) -> list[MirrorCourse]:
+        rows = self._conn.execute("SELECT * FROM courses ORDER BY id")
+        return [MirrorCourse(self._conn, row) for row in rows]
+
+    def get_course(self, course_id, **kwargs) -> MirrorCourse:
+        row = self._conn.execute("SELECT * FROM courses WHERE id = ?", (int(course_id),)).fetchone()
+        if row is None:
+            raise ResourceDoesNotExist(f"Course {course_id} is not in the mirror; run `canvas_mirror.py sync` first")
+        return MirrorCourse(self._conn, row)
+
+
+def open_mirror_canvas(mirror_file: str | None = None) -> MirrorCanvas:
+    mirror_file = mirror_file or os.getenv("CANVAS_MIRROR_FILE", DEFAULT_MIRROR_FILE)
+    if not Path(mirror_file).exists():
+        raise FileNotFoundError(f"Mirror not found at {mirror_file}; run `canvas_mirror.py sync` first")
+    return MirrorCanvas(connect_mirror(mirror_file))
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--mirror",
+        default=os.getenv("CANVAS_MIRROR_FILE", DEFAULT_MIRROR_FILE),
+        help=f"SQLite mirror file (default: {DEFAULT_MIRROR_FILE})",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    sync = commands.add_parser("sync", help="Update the mirror from Canvas")
+    sync.add_argument("--course", type=int, default=os.getenv("CANVAS_COURSE_ID"), help="Course ID")
+    sync.add_argument("--full", action="store_true", help="Crawl every assignment")
+    sync.add_argument(
+        "--groups",
+        default=os.getenv("STUDENT_GROUPS_FILE", notifier.DEFAULT_GROUPS_FILE),
+        help="Student group mapping to mirror",
+    )
+
+    query = commands.add_parser("query", help="List mirrored comments")
+    query.add_argument("--course", type=int)
+    query.add_argument("--assignment", type=int)
+    query.add_argument("--author", type=int)
+    query.add_argument("--group")
+    query.add_argument("--since", help="ISO timestamp, inclusive")
+    query.add_argument("--until", help="ISO timestamp, exclusive")
+    query.add_argument("--limit", type=int)
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None, open_live_canvas=None) -> None:
+    """Run a subcommand; `open_live_canvas` returns a shared live client and is only called by `sync`."""
+    args = parse_args([] if argv is None else argv)
+    conn = connect_mirror(args.mirror)
+
+    if args.command == "sync":
+        if args.course is None:
+            raise ValueError("Missing course: pass --course or set CANVAS_COURSE_ID")
+        api_base = notifier.get_api_base()
+        if Path(args.groups).exists():
+            sync_groups(conn, notifier.load_groups(args.groups))
+
+        started = time.perf_counter()
+        if open_live_canvas is None:
+            canvas = Canvas(api_base, notifier.get_canvas_token())
+        else:
+            canvas = open_live_canvas()
+        stats = sync_course(conn, canvas, int(args.course), full_sweep=args.full)
+        pruned = ", ".join(f"{reason}: {count}" for reason, count in sorted(stats["pruned"].items()))
+        print(
+            f"Synced course {stats['course_id']} in {time.perf_counter() - started:.1f}s | "
+            f"Assignments: {stats['assignments']} | Crawled: {stats['crawled']} | "
+            f"Pruned: {stats['assignments'] - stats['crawled']}"
+            + (f" ({pruned})" if pruned else "")
+            + f" | Comments stored: {stats['comments']}"
+            + (" | Full sweep" if stats["full_sweep"] else "")
+        )
+        return
+
+    rows = query_comments(
+        conn,
+        course_id=args.course,
+        assignment_id=args.assignment,
+        author_id=args.author,
+        group=args.group,
+        since=args.since,
+        until=args.until,
+        limit=args.limit,
+    )
+    for row in rows:
+        print("----------------------------------")
+        print(
+            f"{row['assignment_name']} | {row['author_name']} (ID: {row['author_id']}) | "
+            f"Group: {row['group_name'] or 'No Group'}"
+        )
+        print(f"{row['created_at']}:")
+        print(row["comment"])
+    print(f"\n{len(rows)} comments")
+
+
+if __name__ == "__main__":
+    try:
+        main(sys.argv[1:])
+    except Exception as exc:
+        print(exc)
+        sys.exit(1)
@@ -0,0 +1,221 @@
+"""
+Single entry point for the CanvasChirp tools, sharing one warm Canvas session.
+
+Every subcommand in a process goes through the same Canvas client, pooled
+`requests` session and in-memory GET cache, so `batch` pays for imports, auth
+and connection setup once:
+
+    uv run canvaschirp.py batch "groups" "notify" "course-comments --course 32560 --output out.txt"
+"""
+
+from canvasapi import Canvas
+import argparse
+import os
+import shlex
+import sys
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import canvas_mirror
+import fetch_groups
+import get_noti
+import main as assignment_comments
+import main_all as course_comments
+import notify_course_comments as notifier
+
+sys.stdout.reconfigure(line_buffering=True)
+
+DEFAULT_CACHE_TTL_SECONDS = 300.0
+DEFAULT_POOL_SIZE = 16
+
+
+class CachingSession(requests.Session):
+    """requests.Session with a bigger connection pool that answers repeated GETs from memory.
+
+    Only successful GET responses are cached, keyed by URL, query parameters
+    and the Authorization header, for `ttl` seconds.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_CACHE_TTL_SECONDS, pool_size: int = DEFAULT_POOL_SIZE):
+        super().__init__()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        self.ttl = ttl
+        self.stats = {"requests": 0, "cache_hits": 0}
+        self._cache: dict[tuple, tuple[float, requests.Response]] = {}
+        self._lock = threading.Lock()
+
+    def request(self, method, url, params=None, headers=None, **kwargs):
+        if method.upper() != "GET" or self.ttl <= 0:
+            with self._lock:
+                self.stats["requests"] += 1
+            return super().request(method, url, params=params, headers=headers, **kwargs)
+
+        key = (url, repr(params), (headers or {}).get("Authorization"))
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and time.monotonic() - cached[0] < self.ttl:
+                self.stats["cache_hits"] += 1
+                return cached[1]
+            self.stats["requests"] += 1
+
+        response = super().request(method, url, params=params, headers=headers, **kwargs)
+        if response.ok:
+            with self._lock:
+                self._cache[key] = (time.monotonic(), response)
+        return response
+
+
+class ChirpContext:
+    """Lazily built Canvas client and HTTP session shared by every subcommand in one process."""
+
+    def __init__(self, api_base: str, cache_ttl: float = DEFAULT_CACHE_TTL_SECONDS):
+        self.api_base = api_base
+        self.http = CachingSession(cache_ttl)
+        self._token = None
+        self._canvas = None
+
+    @property
+    def token(self) -> str:
+        if self._token is None:
+            self._token = notifier.get_canvas_token()
+        return self._token
+
+    @property
+    def canvas(self) -> Canvas:
+        if self._canvas is None:
+            self._canvas = Canvas(self.api_base, self.token)
+            # canvasapi keeps its own requests.Session on the requester; swap in the shared one.
+            self._canvas._Canvas__requester._session = self.http
+        return self._canvas
+
+
+def load_group_map(groups_file: str | None = None) -> dict[str, str]:
+    return notifier.load_groups(groups_file or os.getenv("STUDENT_GROUPS_FILE", notifier.DEFAULT_GROUPS_FILE))
+
+
+def run_groups(ctx: ChirpContext, args: argparse.Namespace) -> None:
+    group_map = fetch_groups.fetch_group_map(ctx.canvas, args.category)
+    fetch_groups.save_group_map(group_map, args.file)
+    print(f"Saved {len(group_map)} students to {args.file}")
+
+
+def run_comments(ctx: ChirpContext, args: argparse.Namespace) -> None:
+    assignment_comments.print_assignment_comments(ctx.canvas, args.course, args.assignment, load_group_map())
+
+
+def run_course_comments(ctx: ChirpContext, args: argparse.Namespace) -> None:
+    course = ctx.canvas.get_course(args.course)
+    print(f"Course: {course.name}")
+    group_map = load_group_map()
+    if not args.output:
+        course_comments.print_course_comments(course.get_assignments(), group_map)
+        return
+    with open(args.output, "a" if args.append else "w", encoding="utf-8") as out_stream:
+        course_comments.print_course_comments(course.get_assignments(), group_map, out_stream)
+    print(f"Wrote {args.output}")
+
+
+def run_notifications(ctx: ChirpContext, args: argparse.Namespace) -> None:
+    print(f"Checking notifications for: {ctx.canvas.get_current_user().name}\n")
+    get_noti.print_activity_stream(ctx.http, ctx.api_base, ctx.token)
+
+
+def run_notify(ctx: ChirpContext, args: argparse.Namespace) -> None:
+    notifier.main(args.args, open_live_canvas=lambda: ctx.canvas)
+
+
+def run_mirror(ctx: ChirpContext, args: argparse.Namespace) -> None:
+    canvas_mirror.main(args.args, open_live_canvas=lambda: ctx.canvas)
+
+
+def run_batch(ctx: ChirpContext, args: argparse.Namespace) -> None:
+    operations = list(args.operations)
+    if args.file:
+        with open(args.file, "r", encoding="utf-8") as file:
+            operations.extend(
+                line.strip() for line in file if line.strip() and not line.lstrip().startswith("#")
+            )
+    if not operations:
+        raise ValueError("No operations given: pass them as arguments or with --file")
+
+    parser = build_parser()
+    started = time.perf_counter()
+    for operation in operations:
+        op_args = parse_command(parser, shlex.split(operation))
+        if op_args.command == "batch":
+            raise ValueError("batch operations can't be nested")
+        print(f"\n=== {operation}")
+        op_started = time.perf_counter()
+        op_args.handler(ctx, op_args)
+        print(f"=== {operation}: {time.perf_counter() - op_started:.2f}s")
+
+    stats = ctx.http.stats
+    print(
+        f"\nBatch: {len(operations)} operations in {time.perf_counter() - started:.2f}s | "
+        f"HTTP requests: {stats['requests']} | Cache hits: {stats['cache_hits']}"
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="CanvasChirp tools sharing one Canvas session.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    groups = commands.add_parser("groups", help="Fetch the student group mapping (fetch_groups.py)")
+    groups.add_argument("--category", type=int, default=fetch_groups.GROUP, help="Group category ID")
+    groups.add_argument("--file", default=os.getenv("STUDENT_GROUPS_FILE", fetch_groups.FILE))
+    groups.set_defaults(handler=run_groups)
+
+    comments = commands.add_parser("comments", help="Comments on one assignment (main.py)")
+    comments.add_argument("--course", type=int, default=assignment_comments.COURSE_ID)
+    comments.add_argument("--assignment", type=int, default=assignment_comments.ASSIGNMENT_ID)
+    comments.set_defaults(handler=run_comments)
+
+    all_comments = commands.add_parser("course-comments", help="Student comments on every assignment (main_all.py)")
+    all_comments.add_argument("--course", type=int, required=True)
+    all_comments.add_argument("--output", help="Write to this file instead of the terminal")
+    all_comments.add_argument("--append", action="store_true", help="Append to --output instead of overwriting")
+    all_comments.set_defaults(handler=run_course_comments)
+
+    notifications = commands.add_parser("notifications", help="Recent activity stream (get_noti.py)")
+    notifications.set_defaults(handler=run_notifications)
+
+    # Everything after these two is passed through unchanged (see parse_command).
+    notify = commands.add_parser("notify", help="Post new student comments to Teams (notify_course_comments.py)")
+    notify.set_defaults(handler=run_notify, passthrough=True)
+
+    mirror = commands.add_parser("mirror", help="Local mirror sync/query (canvas_mirror.py)")
+    mirror.set_defaults(handler=run_mirror, passthrough=True)
+
+    batch = commands.add_parser("batch", help="Run several subcommands in this process")
+    batch.add_argument("operations", nargs="*", help='Quoted subcommands, e.g. "groups" "notify --source mirror"')
+    batch.add_argument("--file", help="Read operations from a file, one per line")
+    batch.set_defaults(handler=run_batch)
+    return parser
+
+
+def parse_command(parser: argparse.ArgumentParser, argv: list[str]) -> argparse.Namespace:
+    args, extra = parser.parse_known_args(argv)
+    if extra and not getattr(args, "passthrough", False):
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    args.args = extra
+    return args
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_command(build_parser(), [] if argv is None else argv)
+    api_base = notifier.get_api_base()
+    cache_ttl = float(os.getenv("CANVAS_CACHE_TTL", DEFAULT_CACHE_TTL_SECONDS))
+    args.handler(ChirpContext(api_base, cache_ttl), args)
+
+
+if __name__ == "__main__":
+    try:
+        main(sys.argv[1:])
+    except Exception as exc:
+        print(exc)
+        sys.exit(1)
@@ -0,0 +1,252 @@
+"""
+Full-text searchable archive of student comments (SQLite FTS5).
+
+The notifier feeds every collected comment into the archive when
+`COMMENT_ARCHIVE_FILE` is set, so searching never triggers a Canvas crawl:
+
+    uv run comment_archive.py search "extension" --group A01 --since 2026-02-01
+"""
+
+import argparse
+from datetime import timezone
+import os
+from pathlib import Path
+import sqlite3
+import sys
+
+import notify_course_comments as notifier
+
+sys.stdout.reconfigure(line_buffering=True)
+
+DEFAULT_ARCHIVE_FILE = "comment_archive.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS comments (
+    key TEXT PRIMARY KEY,
+    course_id INTEGER,
+    course_name TEXT,
+    assignment_id INTEGER,
+    assignment_name TEXT,
+    submission_user_id INTEGER,
+    author_id INTEGER,
+    author_name TEXT,
+    group_name TEXT,
+    created_at TEXT,
+    comment TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_comments_assignment ON comments (assignment_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_comments_author ON comments (author_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_comments_created ON comments (created_at);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts USING fts5(
+    comment,
+    author_name,
+    assignment_name,
+    content='comments',
+    tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS comments_ai AFTER INSERT ON comments BEGIN
+    INSERT INTO comments_fts (rowid, comment, author_name, assignment_name)
+    VALUES (new.rowid, new.comment, new.author_name, new.assignment_name);
+END;
+CREATE TRIGGER IF NOT EXISTS comments_ad AFTER DELETE ON comments BEGIN
+    INSERT INTO comments_fts (comments_fts, rowid, comment, author_name, assignment_name)
+    VALUES ('delete', old.rowid, old.comment, old.author_name, old.assignment_name);
+END;
+CREATE TRIGGER IF NOT EXISTS comments_au AFTER UPDATE ON comments BEGIN
+    INSERT INTO comments_fts (comments_fts, rowid, comment, author_name, assignment_name)
+    VALUES ('delete', old.rowid, old.comment, old.author_name, old.assignment_name);
+    INSERT INTO comments_fts (rowid, comment, author_name, assignment_name)
+    VALUES (new.rowid, new.comment, new.author_name, new.assignment_name);
+END;
+"""
+
+
+def connect_archive(archive_file: str) -> sqlite3.Connection:
+    path = Path(archive_file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def add_events(conn: sqlite3.Connection, events: list[dict]) -> int:
+    """Insert new comments and refresh edited ones; returns the number of rows changed.
+
+    Events must carry the notifier's dedupe `key`. Unchanged comments are skipped
+    by the upsert's WHERE clause, so re-feeding a whole crawl is cheap.
+    """
+    rows = [
+        (
+            event["key"],
+            event.get("course_id"),
+            event.get("course_name"),
+            event.get("assignment_id"),
+            event.get("assignment_name"),
+            event.get("submission_user_id"),
+            event.get("author_id"),
+            event.get("author_name"),
+            event.get("group_name"),
+            event.get("created_at"),
+            event.get("comment_text") or "",
+        )
+        for event in events
+        if event.get("key")
+    ]
+    with conn:
+        cursor = conn.executemany(
+            """
+            INSERT INTO comments (
+                key, course_id, course_name, assignment_id, assignment_name,
+                submission_user_id, author_id, author_name, group_name, created_at, comment
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                assignment_name = excluded.assignment_name,
+                author_name = excluded.author_name,
+                group_name = excluded.group_name,
+                comment = excluded.comment
+            WHERE comment IS NOT excluded.comment
+                OR assignment_name IS NOT excluded.assignment_name
+                OR author_name IS NOT excluded.author_name
+                OR group_name IS NOT excluded.group_name
+            """,
+            rows,
+        )
+    return max(cursor.rowcount, 0)
+
+
+def quote_fts_query(query: str) -> str:
+    """Treat every whitespace-separated term as a literal token."""
+    terms = [term.replace('"', '""') for term in query.split()]
+    return " ".join(f'"{term}"' for term in terms)
+
+
+def search(
+    conn: sqlite3.Connection,
+    query: str,
+    author_ids: list[int] | None = None,
+    assignment_id: int | None = None,
+    since: str | None = None,
+    until: str | None = None,
+    limit: int = 20,
+    highlight: tuple[str, str] = ("[", "]"),
+) -> list[sqlite3.Row]:
+    """Rank matching comments by BM25 (comment text weighted highest).
+
+    `query` uses FTS5 syntax (phrases, AND/OR/NOT, prefix*); if it doesn't parse,
+    it is retried with every term quoted.
+    """
+    clauses = ["comments_fts MATCH ?"]
+    filter_params: list = []
+    if author_ids is not None:
+        if not author_ids:
+            return []
+        clauses.append(f"c.author_id IN ({','.join('?' for _ in author_ids)})")
+        filter_params.extend(author_ids)
+    if assignment_id is not None:
+        clauses.append("c.assignment_id = ?")
+        filter_params.append(assignment_id)
+    if since is not None:
+        clauses.append("c.created_at >= ?")
+        filter_params.append(since)
+    if until is not None:
+        clauses.append("c.created_at < ?")
+        filter_params.append(until)
+
+    sql = (
+        "SELECT c.*, bm25(comments_fts, 10.0, 2.0, 1.0) AS rank, "
+        "snippet(comments_fts, 0, ?, ?, '…', 16) AS snippet "
+        "FROM comments_fts JOIN comments AS c ON c.rowid = comments_fts.rowid "
+        f"WHERE {' AND '.join(clauses)} "
+        "ORDER BY rank LIMIT ?"
+    )
+    open_mark, close_mark = highlight
+    try:
+        return conn.execute(sql, [open_mark, close_mark, query, *filter_params, limit]).fetchall()
+    except sqlite3.OperationalError:
+        quoted = quote_fts_query(query)
+        if not quoted:
+            return []
+        return conn.execute(sql, [open_mark, close_mark, quoted, *filter_params, limit]).fetchall()
+
+
+def group_author_ids(group_map: dict[str, str], groups: list[str]) -> list[int]:
+    wanted = {group.strip().lower() for group in groups}
+    return sorted(int(user_id) for user_id, group in group_map.items() if group.strip().lower() in wanted)
+
+
+def normalize_date(value: str | None) -> str | None:
+    """Accept a bare date (YYYY-MM-DD) or a full ISO timestamp."""
+    if value is None:
+        return None
+    parsed = notifier.parse_timestamp(value)
+    if parsed is None:
+        raise ValueError(f"Invalid date: {value}")
+    return parsed.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Search archived student comments.")
+    parser.add_argument(
+        "--archive",
+        default=os.getenv("COMMENT_ARCHIVE_FILE") or DEFAULT_ARCHIVE_FILE,
+        help=f"Archive file (default: COMMENT_ARCHIVE_FILE or {DEFAULT_ARCHIVE_FILE})",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    search_parser = commands.add_parser("search", help="Full-text search over archived comments")
+    search_parser.add_argument("query", help="FTS5 query, e.g. 'extension OR deadline'")
+    search_parser.add_argument("--group", action="append", default=[], help="Group name (repeatable)")
+    search_parser.add_argument(
+        "--groups-file",
+        default=os.getenv("STUDENT_GROUPS_FILE", notifier.DEFAULT_GROUPS_FILE),
+        help="Student group mapping used by --group",
+    )
+    search_parser.add_argument("--assignment", type=int)
+    search_parser.add_argument("--since", help="Date or ISO timestamp, inclusive")
+    search_parser.add_argument("--until", help="Date or ISO timestamp, exclusive")
+    search_parser.add_argument("--limit", type=int, default=20)
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args([] if argv is None else argv)
+    if not Path(args.archive).exists():
+        raise FileNotFoundError(
+            f"Archive not found at {args.archive}; set COMMENT_ARCHIVE_FILE for the notifier to build it"
+        )
+    conn = connect_archive(args.archive)
+
+    author_ids = None
+    if args.group:
+        author_ids = group_author_ids(notifier.load_groups(args.groups_file), args.group)
+
+    highlight = ("\033[1;33m", "\033[0m") if sys.stdout.isatty() else ("[", "]")
+    rows = search(
+        conn,
+        args.query,
+        author_ids=author_ids,
+        assignment_id=args.assignment,
+        since=normalize_date(args.since),
+        until=normalize_date(args.until),
+        limit=args.limit,
+        highlight=highlight,
+    )
+    for row in rows:
+        print("----------------------------------")
+        print(
+            f"{row['created_at'] or 'unknown'} | {row['assignment_name']} | "
+            f"{row['author_name']} (Group: {row['group_name'] or 'No Group'})"
+        )
+        print(row["snippet"])
+    print(f"\n{len(rows)} results")
+
+
+if __name__ == "__main__":
+    try:
+        main(sys.argv[1:])
+    except Exception as exc:
+        print(exc)
+        sys.exit(1)
@@ -0,0 +1,260 @@
+"""
+Per-group engagement aggregates: comment counts and staff first-response times.
+
+When `ENGAGEMENT_FILE` is set, the notifier folds every comment it crawls into
+materialized aggregates (comments per group/assignment/day, time from a
+student's comment to the first staff reply). Each submission thread keeps a
+watermark, so only comments newer than the last run are processed. `report`
+reads the file only and makes no Canvas requests:
+
+    uv run engagement.py report --by group --since 2026-02-01
+"""
+
+import argparse
+import json
+import os
+from pathlib import Path
+import sys
+
+import freshness
+import notify_course_comments as notifier
+
+sys.stdout.reconfigure(line_buffering=True)
+
+DEFAULT_ENGAGEMENT_FILE = "state/course_comment_engagement.json"
+# Upper bounds (seconds) of the response time buckets; the last bucket is open-ended.
+RESPONSE_BUCKETS = (3600, 4 * 3600, 24 * 3600, 3 * 24 * 3600, 7 * 24 * 3600)
+
+
+def empty_engagement() -> dict:
+    return {"version": 1, "watermarks": {}, "open": {}, "comments": {}, "responses": {}}
+
+
+def load_engagement(engagement_file: str) -> dict:
+    path = Path(engagement_file)
+    if not path.exists() or path.stat().st_size == 0:
+        return empty_engagement()
+    with path.open("r", encoding="utf-8") as file:
+        payload = json.load(file)
+    engagement = empty_engagement()
+    if isinstance(payload, dict):
+        for key in engagement:
+            if isinstance(payload.get(key), dict):
+                engagement[key] = payload[key]
+    return engagement
+
+
+def save_engagement(engagement_file: str, engagement: dict) -> None:
+    notifier.save_state(engagement_file, engagement)
+
+
+def comment_day(created_at: str) -> str:
+    return notifier.parse_timestamp(created_at).date().isoformat()
+
+
+def record_response(engagement: dict, group: str, assignment_id: str, day: str, seconds: float) -> None:
+    per_day = engagement["responses"].setdefault(group, {}).setdefault(assignment_id, {})
+    stats = per_day.setdefault(
+        day, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0, "buckets": [0] * (len(RESPONSE_BUCKETS) + 1)}
+    )
+    stats["count"] += 1
+    stats["total_seconds"] += seconds
+    stats["max_seconds"] = max(stats["max_seconds"], seconds)
+    index = next((i for i, bound in enumerate(RESPONSE_BUCKETS) if seconds < bound), len(RESPONSE_BUCKETS))
+    stats["buckets"][index] += 1
+
+
+def update_engagement(engagement: dict, thread_comments: dict[str, list[dict]], group_map: dict[str, str]) -> int:
+    """Fold comments past each thread's watermark into the aggregates; returns how many were new.
+
+    Comments by authors in `group_map` count as student comments and open the
+    thread; the next comment by anyone else closes it as a staff response,
+    attributed to the day and group of the student comment that opened it.
+    """
+    processed = 0
+    for thread_key, comments in thread_comments.items():
+        assignment_id = thread_key.split(":", 1)[0]
+        watermark = engagement["watermarks"].get(thread_key)
+        ordered = sorted(
+            (comment for comment in comments if comment.get("created_at")),
+            key=lambda comment: (comment["created_at"], comment.get("id") or 0),
+        )
+        for comment in ordered:
+            created_at = comment["created_at"]
+            position = [created_at, comment.get("id") or 0]
+            if watermark is not None and position <= watermark:
+                continue
+            watermark = position
+            processed += 1
+            group = group_map.get(str(comment.get("author_id")))
+            if group is not None:
+                per_day = engagement["comments"].setdefault(group, {}).setdefault(assignment_id, {})
+                day = comment_day(created_at)
+                per_day[day] = per_day.get(day, 0) + 1
+                engagement["open"].setdefault(thread_key, {"group": group, "since": created_at})
+                continue
+            opened = engagement["open"].pop(thread_key, None)
+            if opened is not None:
+                seconds = max(
+                    (notifier.parse_timestamp(created_at) - notifier.parse_timestamp(opened["since"])).total_seconds(),
+                    0.0,
+                )
+                record_response(engagement, opened["group"], assignment_id, comment_day(opened["since"]), seconds)
+        if watermark is not None:
+            engagement["watermarks"][thread_key] = watermark
+    return processed
+
+
+def update_engagement_file(engagement_file: str, thread_comments: dict[str, list[dict]], group_map: dict[str, str]) -> int:
+    engagement = load_engagement(engagement_file)
+    processed = update_engagement(engagement, thread_comments, group_map)
+    if processed or not Path(engagement_file).exists():
+        save_engagement(engagement_file, engagement)
+    return processed
+
+
+def bucket_label(index: int) -> str:
+    def label(seconds: int) -> str:
+        return f"{seconds // 3600}h" if seconds < 24 * 3600 else f"{seconds // (24 * 3600)}d"
+
+    if index < len(RESPONSE_BUCKETS):
+        return f"<{label(RESPONSE_BUCKETS[index])}"
+    return f">={label(RESPONSE_BUCKETS[-1])}"
+
+
+def build_report(
+    engagement: dict,
+    by: str = "group",
+    group: str | None = None,
+    assignment_id: str | None = None,
+    since: str | None = None,
+    until: str | None = None,
+) -> list[dict]:
+    """Roll the aggregates up by group, assignment or day; `since`/`until` are inclusive dates."""
+
+    def wanted(row_group: str, row_assignment: str, day: str) -> bool:
+        return (
+            (group is None or row_group.lower() == group.lower())
+            and (assignment_id is None or row_assignment == str(assignment_id))
+            and (since is None or day >= since)
+            and (until is None or day <= until)
+        )
+
+    def row_key(row_group: str, row_assignment: str, day: str) -> str:
+        return {"group": row_group, "assignment": row_assignment, "day": day}[by]
+
+    rows: dict[str, dict] = {}
+
+    def row(key: str) -> dict:
+        return rows.setdefault(
+            key,
+            {
+                "key": key,
+                "comments": 0,
+                "responses": 0,
+                "total_seconds": 0.0,
+                "max_seconds": None,
+                "buckets": [0] * (len(RESPONSE_BUCKETS) + 1),
+                "unanswered": 0,
+                "oldest_unanswered": None,
+            },
+        )
+
+    for row_group, assignments in engagement["comments"].items():
+        for row_assignment, days in assignments.items():
+            for day, count in days.items():
+                if wanted(row_group, row_assignment, day):
+                    row(row_key(row_group, row_assignment, day))["comments"] += count
+
+    for row_group, assignments in engagement["responses"].items():
+        for row_assignment, days in assignments.items():
+            for day, stats in days.items():
+                if not wanted(row_group, row_assignment, day):
+                    continue
+                target = row(row_key(row_group, row_assignment, day))
+                target["responses"] += stats["count"]
+                target["total_seconds"] += stats["total_seconds"]
+                target["max_seconds"] = max(target["max_seconds"] or 0.0, stats["max_seconds"])
+                target["buckets"] = [a + b for a, b in zip(target["buckets"], stats["buckets"])]
+
+    for thread_key, opened in engagement["open"].items():
+        row_assignment = thread_key.split(":", 1)[0]
+        day = comment_day(opened["since"])
+        if not wanted(opened["group"], row_assignment, day):
+            continue
+        target = row(row_key(opened["group"], row_assignment, day))
+        target["unanswered"] += 1
+        if target["oldest_unanswered"] is None or opened["since"] < target["oldest_unanswered"]:
+            target["oldest_unanswered"] = opened["since"]
+
+    for target in rows.values():
+        target["mean_seconds"] = target["total_seconds"] / target["responses"] if target["responses"] else None
+        target["median_bucket"] = None
+        cumulative = 0
+        for index, count in enumerate(target["buckets"]):
+            cumulative += count
+            if target["responses"] and cumulative * 2 >= target["responses"]:
+                target["median_bucket"] = bucket_label(index)
+                break
+    return sorted(rows.values(), key=lambda item: item["key"])
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Report per-group comment counts and staff response times.")
+    parser.add_argument(
+        "--file",
+        default=os.getenv("ENGAGEMENT_FILE") or DEFAULT_ENGAGEMENT_FILE,
+        help=f"Aggregates file (default: ENGAGEMENT_FILE or {DEFAULT_ENGAGEMENT_FILE})",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    report = commands.add_parser("report", help="Summarize the aggregates (no Canvas requests)")
+    report.add_argument("--by", choices=["group", "assignment", "day"], default="group")
+    report.add_argument("--group")
+    report.add_argument("--assignment", type=int)
+    report.add_argument("--since", help="Date (YYYY-MM-DD), inclusive")
+    report.add_argument("--until", help="Date (YYYY-MM-DD), inclusive")
+    return parser.parse_args(argv)
+
+
+def normalize_day(value: str | None) -> str | None:
+    if value is None:
+        return None
+    parsed = notifier.parse_timestamp(value)
+    if parsed is None:
+        raise ValueError(f"Invalid date: {value}")
+    return parsed.date().isoformat()
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args([] if argv is None else argv)
+    if not Path(args.file).exists():
+        raise FileNotFoundError(
+            f"Aggregates not found at {args.file}; set ENGAGEMENT_FILE for the notifier to build them"
+        )
+    rows = build_report(
+        load_engagement(args.file),
+        by=args.by,
+        group=args.group,
+        assignment_id=args.assignment,
+        since=normalize_day(args.since),
+        until=normalize_day(args.until),
+    )
+    for row in rows:
+        line = (
+            f"{row['key']} | comments {row['comments']} | responses {row['responses']} | "
+            f"mean {freshness.format_seconds(row['mean_seconds'])} | median {row['median_bucket'] or '-'} | "
+            f"max {freshness.format_seconds(row['max_seconds'])}"
+        )
+        if row["unanswered"]:
+            line += f" | unanswered {row['unanswered']} (oldest {row['oldest_unanswered']})"
+        print(line)
+    print(f"\n{len(rows)} rows")
+
+
+if __name__ == "__main__":
+    try:
+        main(sys.argv[1:])
+    except Exception as exc:
+        print(exc)
+        sys.exit(1)
@@ -2,32 +2,37 @@ from canvasapi import Canvas
 import os
 import sys
 import json
+
+import notify_course_comments as notifier
 sys.stdout.reconfigure(line_buffering=True)
 
-API = "https://canvas.tue.nl"
-TOKEN = "token"
+API = notifier.get_api_base()
 GROUP = 25446
 FILE = "student_groups.json"
 
 def token():
-    with open(TOKEN, "r") as f:
-        return f.read().strip()
+    return notifier.get_canvas_token()
+
+def fetch_group_map(canvas, category_id):
+    cat = canvas.get_group_category(category_id)
+    groups = cat.get_groups()
+
+    map = {}
+    for g in groups:
+        print(f"  Processing group: {g.name}...", end="\r")
+        for u in g.get_users():
+            map[str(u.id)] = g.name
+    return map
+
+def save_group_map(map, fname=FILE):
+    with open(fname, "w") as f:
+        json.dump(map, f, indent=2)
 
 def main():
     api = token()
     try:
         canvas = Canvas(API, api)
-        cat = canvas.get_group_category(GROUP)
-        groups = cat.get_groups()
-
-        map = {}
-        for g in groups:
-            print(f"  Processing group: {g.name}...", end="\r")
-            for u in g.get_users():
-                map[str(u.id)] = g.name
-
-        with open(FILE, "w") as f:
-            json.dump(map, f, indent=2)
+        save_group_map(fetch_group_map(canvas, GROUP))
 
     except Exception as e:
         print(e)
@@ -0,0 +1,202 @@
+"""
+Notification freshness: how long after a comment was written it reached Teams.
+
+The notifier stores `delivered_at` on every seen entry it posts and keeps a
+per-run summary (lag percentiles, histogram, SLO verdict) in the state file.
+`report` reads that history without touching Canvas:
+
+    uv run freshness.py report --days 30
+"""
+
+import argparse
+from datetime import datetime, timedelta, timezone
+import math
+import os
+import sys
+
+import notify_course_comments as notifier
+
+sys.stdout.reconfigure(line_buffering=True)
+
+# Upper bounds (seconds) of the lag histogram buckets; the last bucket is open-ended.
+LAG_BUCKETS = (60, 300, 900, 3600, 4 * 3600, 24 * 3600, 3 * 24 * 3600)
+DEFAULT_SLO_PERCENTILE = 95.0
+
+
+def bucket_labels() -> list[str]:
+    def label(seconds: int) -> str:
+        if seconds < 3600:
+            return f"{seconds // 60}m"
+        if seconds < 24 * 3600:
+            return f"{seconds // 3600}h"
+        return f"{seconds // (24 * 3600)}d"
+
+    return [f"<{label(bound)}" for bound in LAG_BUCKETS] + [f">={label(LAG_BUCKETS[-1])}"]
+
+
+def delivery_lag(entry: dict) -> float | None:
+    """Seconds between a comment's `created_at` and its `delivered_at`, if both are known.
+
+    Edit and deletion notifications don't count: their `created_at` is the original comment's.
+    """
+    if entry.get("change"):
+        return None
+    created_at = notifier.parse_timestamp(entry.get("created_at"))
+    delivered_at = notifier.parse_timestamp(entry.get("delivered_at"))
+    if created_at is None or delivered_at is None:
+        return None
+    return max((delivered_at - created_at).total_seconds(), 0.0)
+
+
+def percentile(sorted_values: list[float], pct: float) -> float | None:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def lag_histogram(lags: list[float]) -> list[int]:
+    counts = [0] * (len(LAG_BUCKETS) + 1)
+    for lag in lags:
+        index = next((i for i, bound in enumerate(LAG_BUCKETS) if lag < bound), len(LAG_BUCKETS))
+        counts[index] += 1
+    return counts
+
+
+def summarize_lags(
+    lags: list[float],
+    slo_seconds: float | None = None,
+    slo_percentile: float = DEFAULT_SLO_PERCENTILE,
+) -> dict:
+    values = sorted(lags)
+    summary = {
+        "delivered": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "max": values[-1] if values else None,
+        "histogram": lag_histogram(values),
+    }
+    if slo_seconds:
+        observed = percentile(values, slo_percentile)
+        summary["slo"] = {
+            "seconds": slo_seconds,
+            "percentile": slo_percentile,
+            "violated": observed is not None and observed > slo_seconds,
+        }
+    return summary
+
+
+def run_summary(
+    seen: dict,
+    keys: list[str],
+    run_at: str,
+    slo_seconds: float | None = None,
+    slo_percentile: float = DEFAULT_SLO_PERCENTILE,
+) -> dict:
+    """Summarize the lags of the comments this run delivered; baseline and dropped entries don't count."""
+    lags = [lag for key in dict.fromkeys(keys) if (lag := delivery_lag(seen.get(key, {}))) is not None]
+    return {"run_at": run_at, **summarize_lags(lags, slo_seconds, slo_percentile)}
+
+
+def format_seconds(value: float | None) -> str:
+    if value is None:
+        return "-"
+    if value < 120:
+        return f"{value:.0f}s"
+    if value < 2 * 3600:
+        return f"{value / 60:.1f}m"
+    if value < 2 * 24 * 3600:
+        return f"{value / 3600:.1f}h"
+    return f"{value / (24 * 3600):.1f}d"
+
+
+def format_summary(summary: dict) -> str:
+    text = (
+        f"Freshness: {summary['delivered']} delivered | p50 {format_seconds(summary['p50'])} | "
+        f"p95 {format_seconds(summary['p95'])} | max {format_seconds(summary['max'])}"
+    )
+    slo = summary.get("slo")
+    if slo:
+        verdict = "VIOLATED" if slo["violated"] else "met"
+        text += f" | SLO p{slo['percentile']:g} <= {format_seconds(slo['seconds'])}: {verdict}"
+    return text
+
+
+def build_report(
+    state: dict,
+    since: datetime,
+    slo_seconds: float | None = None,
+    slo_percentile: float = DEFAULT_SLO_PERCENTILE,
+) -> dict:
+    """Rolling lag distribution over deliveries since `since`, plus the runs in that window."""
+    lags = []
+    for entry in state.get("seen", {}).values():
+        delivered_at = notifier.parse_timestamp(entry.get("delivered_at"))
+        if delivered_at is None or delivered_at < since:
+            continue
+        lag = delivery_lag(entry)
+        if lag is not None:
+            lags.append(lag)
+    runs = [
+        run
+        for run in state.get("freshness", [])
+        if (run_at := notifier.parse_timestamp(run.get("run_at"))) is not None and run_at >= since
+    ]
+    return {
+        "rolling": summarize_lags(lags, slo_seconds, slo_percentile),
+        "runs": runs,
+        "violations": sum(1 for run in runs if (run.get("slo") or {}).get("violated")),
+    }
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Report how quickly student comments reach Teams.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    report = commands.add_parser("report", help="Lag percentiles, histogram and SLO violations from the state file")
+    report.add_argument("--state", default=os.getenv("STATE_FILE", notifier.DEFAULT_STATE_FILE))
+    report.add_argument("--days", type=float, default=30, help="Rolling window (default: 30)")
+    report.add_argument(
+        "--slo",
+        type=float,
+        default=float(os.getenv("FRESHNESS_SLO_SECONDS", "0") or 0) or None,
+        help="Freshness SLO in seconds (default: FRESHNESS_SLO_SECONDS)",
+    )
+    report.add_argument(
+        "--percentile",
+        type=float,
+        default=float(os.getenv("FRESHNESS_SLO_PERCENTILE", DEFAULT_SLO_PERCENTILE)),
+    )
+    report.add_argument("--runs", type=int, default=10, help="Number of recent runs to list")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args([] if argv is None else argv)
+    state, state_exists = notifier.load_state(args.state)
+    if not state_exists:
+        raise FileNotFoundError(f"State not found at {args.state}")
+
+    since = datetime.now(timezone.utc) - timedelta(days=args.days)
+    report = build_report(state, since, args.slo, args.percentile)
+    rolling = report["rolling"]
+
+    print(f"Last {args.days:g} days")
+    print(format_summary(rolling))
+    total = rolling["delivered"] or 1
+    for label, count in zip(bucket_labels(), rolling["histogram"]):
+        print(f"  {label:>6} {count:6d} {'#' * round(40 * count / total)}")
+
+    runs = report["runs"]
+    print(f"\nRuns: {len(runs)} | SLO violations: {report['violations']}")
+    for run in runs[-args.runs:]:
+        print(f"- {run['run_at']} | {format_summary(run)}")
+
+
+if __name__ == "__main__":
+    try:
+        main(sys.argv[1:])
+    except Exception as exc:
+        print(exc)
+        sys.exit(1)
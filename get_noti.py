@@ -7,31 +7,26 @@ from canvasapi import Canvas
 import requests
 import sys
 from datetime import datetime
+
+import notify_course_comments as notifier
 sys.stdout.reconfigure(line_buffering=True)
 
-API = "https://canvas.tue.nl"
-TOKEN = "token"
+API = notifier.get_api_base()
 
 def token():
-    with open(TOKEN, "r") as f:
-        return f.read().strip()
-
-def main():
-    api = token()
-    canvas = Canvas(API, api)
-    user = canvas.get_current_user()
-    print(f"Checking notifications for: {user.name}\n")
+    return notifier.get_canvas_token()
 
+def print_activity_stream(session, api_base, api):
     # Direct API call to get notifications
     headers = {'Authorization': f'Bearer {api}'}
 
     # Try the notification preferences endpoint
-    notif_url = f"{API}/api/v1/users/self/communication_channels"
-    response = requests.get(notif_url, headers=headers)
+    notif_url = f"{api_base}/api/v1/users/self/communication_channels"
+    response = session.get(notif_url, headers=headers)
     print(f"Communication channels status: {response.status_code}\n")
 
-    stream_url = f"{API}/api/v1/users/self/activity_stream"
-    response = requests.get(stream_url, headers=headers)
+    stream_url = f"{api_base}/api/v1/users/self/activity_stream"
+    response = session.get(stream_url, headers=headers)
 
     if response.status_code == 200:
         activities = response.json()
@@ -54,5 +49,13 @@ def main():
         print(f"Could not fetch activity stream: {response.status_code}")
         print(response.text)
 
+def main():
+    api = token()
+    canvas = Canvas(API, api)
+    user = canvas.get_current_user()
+    print(f"Checking notifications for: {user.name}\n")
+
+    print_activity_stream(requests, API, api)
+
 if __name__ == "__main__":
     main()
@@ -1,64 +1,79 @@
 from canvasapi import Canvas
+import argparse
 import os
 import sys
 import json
+
+import canvas_mirror
+import notify_course_comments as notifier
 sys.stdout.reconfigure(line_buffering=True)
 
-API = "https://canvas.tue.nl"
-TOKEN = "token"
+API = notifier.get_api_base()
 COURSE_ID = 32560
 ASSIGNMENT_ID = 146385
 GFILE = "student_groups.json"
 
 def token():
-    with open(TOKEN, "r") as f:
-        return f.read().strip()
+    return notifier.get_canvas_token()
 
 def get_group():
     with open(GFILE, "r") as f:
         return json.load(f)
 
-def main():
-    api = token()
-    try:
-        canvas = Canvas(API, api)
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Print submission comments for one assignment.")
+    parser.add_argument("--source", choices=["live", "mirror"], default="live")
+    parser.add_argument("--mirror", default=None, help="Mirror file when --source=mirror")
+    return parser.parse_args(argv)
 
-        print(f"{canvas.get_current_user().name} - {canvas.get_current_user().id}")
+def open_canvas(args):
+    if args.source == "mirror":
+        return canvas_mirror.open_mirror_canvas(args.mirror)
+    return Canvas(API, token())
+
+def print_assignment_comments(canvas, course_id, assignment_id, group):
+    course = canvas.get_course(course_id)
+    print(f"Course: {course.name}")
 
-        course = canvas.get_course(COURSE_ID)
-        print(f"Course: {course.name}")
+    ass = course.get_assignment(assignment_id)
+    print(f"Assignment: {ass.name}")
 
-        group = get_group()
-        ass = course.get_assignment(ASSIGNMENT_ID)
-        print(f"Assignment: {ass.name}")
+    sub = ass.get_submissions(include=["submission_comments", "user"])
+    count = 0
+    for s in sub:
+        if (hasattr(s, "submission_comments") and s.submission_comments):
+            if hasattr(s, "user"):
+                student_name = getattr(s.user, "name", f"Student {s.user_id}")
+            group_name = group.get(str(s.user_id), "No Group")
 
-        sub = ass.get_submissions(include=["submission_comments", "user"])
-        count = 0
-        for s in sub:
-            if (hasattr(s, "submission_comments") and s.submission_comments):
-                if hasattr(s, "user"):
-                    student_name = getattr(s.user, "name", f"Student {s.user_id}")
-                group_name = group.get(str(s.user_id), "No Group")
+            print(f"\nStudent: {student_name}, ID: {s.user_id}, Group: {group_name}")
 
-                print(f"\nStudent: {student_name}, ID: {s.user_id}, Group: {group_name}")
+            for c in s.submission_comments:
+                author_name = c.get("author_name")
+                comment = c.get("comment")
+                created_at = c.get("created_at")
+                print(f"{created_at} - {author_name}:")
+                print(f"{comment}")
 
-                for c in s.submission_comments:
-                    author_name = c.get("author_name")
-                    comment = c.get("comment")
-                    created_at = c.get("created_at")
-                    print(f"{created_at} - {author_name}:")
-                    print(f"{comment}")
+            count += 1
 
-                count += 1
+    if count == 0:
+        print("\nNo submission comments.")
+    else:
+        print(f"\n{count} comments")
+
+def main(argv=None):
+    args = parse_args([] if argv is None else argv)
+    try:
+        canvas = open_canvas(args)
+
+        print(f"{canvas.get_current_user().name} - {canvas.get_current_user().id}")
 
-        if count == 0:
-            print("\nNo submission comments.")
-        else:
-            print(f"\n{count} comments")
+        print_assignment_comments(canvas, COURSE_ID, ASSIGNMENT_ID, get_group())
 
     except Exception as e:
         print(e)
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
+    main(sys.argv[1:])
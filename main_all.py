@@ -1,15 +1,23 @@
 from canvasapi import Canvas
+import argparse
+import os
 import sys
 import json
+import threading
+import time
+from types import SimpleNamespace
+
+import canvas_mirror
+import notify_course_comments as notifier
 sys.stdout.reconfigure(line_buffering=True)
 
-API = "https://canvas.tue.nl"
-TOKEN = "token"
+API = notifier.get_api_base()
 GFILE = "student_groups.json"
+COURSE_CACHE = "course_catalogue.json"
+COURSE_CACHE_TTL_HOURS = 24
 
 def token():
-    with open(TOKEN, "r") as f:
-        return f.read().strip()
+    return notifier.get_canvas_token()
 
 def get_group():
     with open(GFILE, "r") as f:
@@ -23,9 +31,74 @@ def fetch_courses(canvas, include_concluded=True, state="available"):
             return list(canvas.get_courses(state=[state]))
         except TypeError:
             pass
+        try:
+            return list(canvas.get_courses(enrollment_state=state))
+        except TypeError:
+            pass
     return list(canvas.get_courses())
 
 
+def load_course_catalogue(fname=COURSE_CACHE):
+    try:
+        with open(fname, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def refresh_course_catalogue(canvas, state="available", fname=COURSE_CACHE):
+    courses = fetch_courses(canvas, include_concluded=True, state=state)
+    entries = [
+        {"id": c.id, "name": getattr(c, "name", None), "course_code": getattr(c, "course_code", None)}
+        for c in courses
+    ]
+    catalogue = load_course_catalogue(fname)
+    catalogue[f"{API}|{state}"] = {"fetched_at": time.time(), "courses": entries}
+    tmp = fname + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(catalogue, f, indent=2)
+    os.replace(tmp, fname)
+    return [SimpleNamespace(**entry) for entry in entries]
+
+
+def cached_courses(canvas, state="available", fname=COURSE_CACHE, ttl_hours=COURSE_CACHE_TTL_HOURS, refresh=False):
+    """Courses from the local catalogue instead of enumerating every enrollment on Canvas.
+
+    Returns (courses, thread). A missing catalogue (or `refresh`) is fetched right away;
+    a stale one is returned as is while `thread` refreshes the file in the background.
+    """
+    entry = load_course_catalogue(fname).get(f"{API}|{state}")
+    if refresh or not entry:
+        return refresh_course_catalogue(canvas, state, fname), None
+
+    courses = [SimpleNamespace(**course) for course in entry["courses"]]
+    if time.time() - entry["fetched_at"] < ttl_hours * 3600:
+        return courses, None
+
+    def background_refresh():
+        try:
+            refresh_course_catalogue(canvas, state, fname)
+        except Exception as e:
+            print(f"Course catalogue refresh failed: {e}")
+
+    thread = threading.Thread(target=background_refresh, daemon=True)
+    thread.start()
+    return courses, thread
+
+
+def find_courses(courses, query):
+    """Courses whose ID equals `query`, or whose name or course code contains it (case-insensitive)."""
+    query = query.strip()
+    if query.isdigit():
+        return [c for c in courses if str(c.id) == query]
+    query = query.lower()
+    return [
+        c for c in courses
+        if query in (getattr(c, "name", None) or "").lower()
+        or query in (getattr(c, "course_code", None) or "").lower()
+    ]
+
+
 def select_course(courses, input_fn=input, print_fn=print):
     if not courses:
         return None
@@ -38,35 +111,109 @@ def select_course(courses, input_fn=input, print_fn=print):
 
     while True:
         choice = input_fn("Select a course by number: ").strip()
-        selected_index = int(choice)
-        if 1 <= selected_index <= len(courses):
-            return courses[selected_index - 1]
-        print_fn("Wrong input")
+        if choice.isdigit() and 1 <= int(choice) <= len(courses):
+            return courses[int(choice) - 1]
+        print_fn(f"Invalid selection. Enter a number from 1 to {len(courses)}.")
 
-def main():
-    api = token()
+def print_course_comments(assignments, group, out_stream=None):
+    if out_stream is None:
+        out_stream = sys.stdout
+    for a in assignments:
+        if out_stream != sys.stdout:
+            print(f"Processing: {a.name}", file=sys.stdout)
+        print("======================================================================", file=out_stream)
+        print(f"Assignment: {a.name}", file=out_stream)
+        sub = a.get_submissions(include=["submission_comments", "user"])
+        count = 0
+        for s in sub:
+            if (hasattr(s, "submission_comments") and s.submission_comments):
+                if hasattr(s, "user"):
+                    student_name = getattr(s.user, "name", f"Student {s.user_id}")
+                group_name = group.get(str(s.user_id), "No Group")
+
+                # https://canvas.instructure.com/doc/api/submissions.html#SubmissionComment
+                for c in s.submission_comments:
+                    aid = c.get("author_id")
+                    if str(aid) not in group: # O(1)
+                        continue
+
+                    print("----------------------------------", file=out_stream)
+                    print(f"Student: {student_name}, ID: {s.user_id}, Group: {group_name}", file=out_stream)
+                    author_name = c.get("author_name")
+                    comment = c.get("comment")
+                    created_at = c.get("created_at")
+                    print(f"{created_at} - {author_name}:", file=out_stream)
+                    print(f"{comment}", file=out_stream)
+                count += 1
+        if count == 0:
+            print("\nNo submission comments.", file=out_stream)
+        else:
+            print(f"\n{count} comments\n", file=out_stream)
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Print student comments for every assignment of a course.")
+    parser.add_argument("--source", choices=["live", "mirror"], default="live")
+    parser.add_argument("--mirror", default=None, help="Mirror file when --source=mirror")
+    parser.add_argument("--course", help="Course ID or part of its name/code; skips the course prompt")
+    parser.add_argument("--state", choices=["available", "completed"], default="available", help="Which courses to list")
+    parser.add_argument("--refresh-courses", action="store_true", help=f"Re-fetch the course list into {COURSE_CACHE}")
+    parser.add_argument("--output", help="Write to this file instead of asking")
+    parser.add_argument("--append", action="store_true", help="Append to --output instead of overwriting")
+    return parser.parse_args(argv)
+
+def open_canvas(args):
+    if args.source == "mirror":
+        return canvas_mirror.open_mirror_canvas(args.mirror)
+    return Canvas(API, token())
+
+def choose_course(canvas, args):
+    """Pick the course from --course or the prompt; returns (course, background refresh thread or None)."""
+    if args.course and args.course.strip().isdigit():
+        # A known ID needs no course list at all.
+        return canvas.get_course(int(args.course)), None
+
+    refresh = None
+    if args.source == "mirror":
+        courses = fetch_courses(canvas, include_concluded=True, state=args.state)
+    else:
+        courses, refresh = cached_courses(canvas, args.state, refresh=args.refresh_courses)
+    if not courses:
+        print("No courses found.")
+        return None, refresh
+
+    if not args.course:
+        selected = select_course(courses)
+        if selected is None:
+            print("No course selected.")
+            return None, refresh
+        return canvas.get_course(selected.id), refresh
+
+    matches = find_courses(courses, args.course)
+    if not matches and refresh is not None:
+        # The cached list may predate the course; wait for the refresh and look again.
+        refresh.join()
+        courses, refresh = cached_courses(canvas, args.state)
+        matches = find_courses(courses, args.course)
+    if len(matches) != 1:
+        listed = "\n".join(f"  {getattr(c, 'name', '?')} (ID: {c.id})" for c in matches)
+        raise ValueError(
+            f"No course matches '{args.course}'" if not matches
+            else f"'{args.course}' matches {len(matches)} courses:\n{listed}"
+        )
+    return canvas.get_course(matches[0].id), refresh
+
+def main(argv=None):
+    args = parse_args([] if argv is None else argv)
     try:
-        canvas = Canvas(API, api)
-
-        print(f"{canvas.get_current_user().name} - {canvas.get_current_user().id}")
-
-        # choice = input("Completed (1) or available course (2): ").strip()
-        # if choice == "1":
-        #     courses = fetch_courses(canvas, include_concluded=True, state="completed")
-        # elif choice == "2":
-        #     courses = fetch_courses(canvas, include_concluded=True, state="available")
-        # else:
-        #     print("Wrong input")
-        #     return
-        courses = fetch_courses(canvas, include_concluded=True, state="available")
-
-        if not courses:
-            print("No courses found.")
-            return
+        canvas = open_canvas(args)
+
+        user = canvas.get_current_user()
+        print(f"{user.name} - {user.id}")
 
-        course = select_course(courses)
+        course, refresh = choose_course(canvas, args)
         if course is None:
-            print("No course selected.")
+            if refresh is not None:
+                refresh.join()
             return
 
         print(f"Course: {course.name}")
@@ -75,53 +222,28 @@ def main():
         ass = course.get_assignments()
 
         out_stream = sys.stdout
-        choice_dest = input("\nOutput to (T)erminal or (F)ile? [T/F]: ").strip().lower()
-        if choice_dest == 'f':
-            fname = input(f"Enter filename (if none provided, defaults to course_{course.id}_output.txt): ").strip()
-            if not fname:
-                fname = f"course_{course.id}_output.txt"
-            choice_mode = input("(O)verwrite or (A)ppend? [O/A]: ").strip().lower()
-            mode = 'a' if choice_mode == 'a' else 'w'
+        fname, mode = args.output, "a" if args.append else "w"
+        if fname is None and args.course is None:
+            choice_dest = input("\nOutput to (T)erminal or (F)ile? [T/F]: ").strip().lower()
+            if choice_dest == 'f':
+                fname = input(f"Enter filename (if none provided, defaults to course_{course.id}_output.txt): ").strip()
+                if not fname:
+                    fname = f"course_{course.id}_output.txt"
+                choice_mode = input("(O)verwrite or (A)ppend? [O/A]: ").strip().lower()
+                mode = 'a' if choice_mode == 'a' else 'w'
+        if fname:
             print(f"Opening '{fname}' for {'appending' if mode == 'a' else 'writing'}...")
             out_stream = open(fname, mode, encoding="utf-8")
-        
-        for a in ass:
-            if out_stream != sys.stdout:
-                print(f"Processing: {a.name}", file=sys.stdout)
-            print("======================================================================", file=out_stream)
-            print(f"Assignment: {a.name}", file=out_stream)
-            sub = a.get_submissions(include=["submission_comments", "user"])
-            count = 0
-            for s in sub:
-                if (hasattr(s, "submission_comments") and s.submission_comments):
-                    if hasattr(s, "user"):
-                        student_name = getattr(s.user, "name", f"Student {s.user_id}")
-                    group_name = group.get(str(s.user_id), "No Group")
-
-                    # https://canvas.instructure.com/doc/api/submissions.html#SubmissionComment
-                    for c in s.submission_comments:
-                        aid = c.get("author_id")
-                        if str(aid) not in group: # O(1)
-                            continue
-
-                        print("----------------------------------", file=out_stream)
-                        print(f"Student: {student_name}, ID: {s.user_id}, Group: {group_name}", file=out_stream)
-                        author_name = c.get("author_name")
-                        comment = c.get("comment")
-                        created_at = c.get("created_at")
-                        print(f"{created_at} - {author_name}:", file=out_stream)
-                        print(f"{comment}", file=out_stream)
-                    count += 1
-            if count == 0:
-                print("\nNo submission comments.", file=out_stream)
-            else:
-                print(f"\n{count} comments\n", file=out_stream)
+
+        print_course_comments(ass, group, out_stream)
         if out_stream is not sys.stdout:
             print("Done.")
             out_stream.close()
+        if refresh is not None:
+            refresh.join()
     except Exception as e:
         print(e)
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
+    main(sys.argv[1:])
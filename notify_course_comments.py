@@ -1,9 +1,16 @@
 from canvasapi import Canvas
+import argparse
+from datetime import datetime, timedelta, timezone
 import hashlib
+import itertools
 import json
+import math
 import os
 from pathlib import Path
+import queue
+import re
 import sys
+import threading
 import time
 from urllib import error as url_error
 from urllib import request as url_request
@@ -15,6 +22,47 @@ DEFAULT_API_BASE = "https://canvas.tue.nl"
 DEFAULT_TOKEN_FILE = "token"
 DEFAULT_GROUPS_FILE = "student_groups.json"
 DEFAULT_STATE_FILE = "state/course_comment_dedupe.json"
+DEFAULT_DEAD_LETTER_FILE = "state/course_comment_dead_letters.json"
+DEFAULT_DEAD_LETTER_MAX_ATTEMPTS = 10
+DEFAULT_DEAD_LETTER_MAX_AGE_HOURS = 72
+DEFAULT_FULL_SWEEP_HOURS = 168
+DEFAULT_DORMANT_DAYS = 14
+DEFAULT_FRESHNESS_HISTORY_RUNS = 500
+# Teams webhooks reject bodies over about 28 KB; leave room for the card wrapper.
+DEFAULT_DIGEST_MAX_BYTES = 20000
+DEFAULT_DIGEST_MAX_EVENTS = 50
+DEFAULT_PRIORITY_RULES = {
+    "recency_weight": 10.0,
+    "recency_half_life_hours": 24.0,
+    "due_soon_weight": 20.0,
+    "due_soon_hours": 72.0,
+    "group_weight": 15.0,
+    "groups": [],
+    "keyword_weight": 30.0,
+    "keywords": ["urgent", "extension", "deadline"],
+}
+DEAD_LETTER_EVENT_FIELDS = (
+    "key",
+    "course_id",
+    "course_name",
+    "assignment_id",
+    "assignment_name",
+    "assignment_url",
+    "assignment_due_at",
+    "submission_user_id",
+    "author_id",
+    "author_name",
+    "group_name",
+    "created_at",
+    "comment_text",
+    "change",
+)
+DIGEST_TITLE = "Canvas student comment digest"
+COMMENT_CHANGE_TITLES = {
+    None: "New Canvas student comment",
+    "edited": "Edited Canvas student comment",
+    "deleted": "Deleted Canvas student comment",
+}
 
 
 def require_env(name: str) -> str:
@@ -24,6 +72,10 @@ def require_env(name: str) -> str:
     return value
 
 
+def get_api_base() -> str:
+    return os.getenv("CANVAS_API_BASE", DEFAULT_API_BASE).strip() or DEFAULT_API_BASE
+
+
 def get_canvas_token() -> str:
     env_token = os.getenv("CANVAS_TOKEN", "").strip()
     if env_token:
@@ -56,10 +108,23 @@ def load_state(state_file: str) -> tuple[dict, bool]:
     with path.open("r", encoding="utf-8") as file:
         payload = json.load(file)
 
-    seen = payload.get("seen", {}) if isinstance(payload, dict) else {}
+    if not isinstance(payload, dict):
+        payload = {}
+    seen = payload.get("seen", {})
     if not isinstance(seen, dict):
         seen = {}
-    return {"version": 1, "seen": seen}, True
+    state = {"version": 1, "seen": seen}
+
+    assignments = payload.get("assignments")
+    if isinstance(assignments, dict):
+        state["assignments"] = assignments
+    if isinstance(payload.get("last_full_sweep"), str):
+        state["last_full_sweep"] = payload["last_full_sweep"]
+    if isinstance(payload.get("freshness"), list):
+        state["freshness"] = payload["freshness"]
+    if isinstance(payload.get("threads"), dict):
+        state["threads"] = payload["threads"]
+    return state, True
 
 
 def save_state(state_file: str, state: dict) -> None:
@@ -72,6 +137,202 @@ def save_state(state_file: str, state: dict) -> None:
     tmp_path.replace(path)
 
 
+def parse_shard(value: str) -> tuple[int, int]:
+    """Parse a 1-based `i/n` shard spec."""
+    try:
+        index_text, count_text = value.split("/", 1)
+        index, count = int(index_text), int(count_text)
+    except ValueError:
+        raise ValueError(f"Invalid shard '{value}', expected i/n (e.g. 2/4)") from None
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Invalid shard '{value}', expected 1 <= i <= n")
+    return index, count
+
+
+def assignment_shard(assignment_id, shard_count: int) -> int:
+    """Stable 1-based shard for an assignment, identical across runners and Python versions."""
+    digest = hashlib.sha256(str(assignment_id).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % shard_count + 1
+
+
+def shard_fragment_path(state_file: str, shard: tuple[int, int]) -> str:
+    path = Path(state_file)
+    index, count = shard
+    return str(path.parent / "shards" / f"{path.stem}.shard-{index}-of-{count}{path.suffix}")
+
+
+def build_state_fragment(
+    shard: tuple[int, int],
+    seen: dict,
+    new_keys: list[str],
+    activity: dict,
+    last_full_sweep: str | None = None,
+    dead_letters: dict | None = None,
+    freshness_run: dict | None = None,
+    threads: dict | None = None,
+) -> dict:
+    fragment = {
+        "version": 1,
+        "shard": f"{shard[0]}/{shard[1]}",
+        "seen": {key: seen[key] for key in new_keys},
+        "assignments": activity,
+        "dead_letters": dead_letters or {},
+    }
+    if last_full_sweep:
+        fragment["last_full_sweep"] = last_full_sweep
+    if freshness_run:
+        fragment["freshness"] = [freshness_run]
+    if threads is not None:
+        fragment["threads"] = threads
+    return fragment
+
+
+def merge_state_fragments(state: dict, fragments: list[dict]) -> int:
+    """Fold shard fragments into the full state; returns the number of newly seen keys."""
+    seen = state.setdefault("seen", {})
+    records = state.setdefault("assignments", {})
+    added = 0
+    for fragment in fragments:
+        for key, entry in (fragment.get("seen") or {}).items():
+            if key not in seen:
+                added += 1
+            seen[key] = entry
+        records.update(fragment.get("assignments") or {})
+        last_full_sweep = fragment.get("last_full_sweep")
+        if last_full_sweep and last_full_sweep > state.get("last_full_sweep", ""):
+            state["last_full_sweep"] = last_full_sweep
+        for run in fragment.get("freshness") or []:
+            record_freshness_run(state, run)
+        if fragment.get("threads"):
+            update_comment_threads(state.setdefault("threads", {}), fragment["threads"])
+    return added
+
+
+def record_freshness_run(state: dict, run: dict, limit: int = DEFAULT_FRESHNESS_HISTORY_RUNS) -> None:
+    """Append a per-run lag summary (see freshness.py), keeping the newest `limit` runs."""
+    runs = state.setdefault("freshness", [])
+    runs.append(run)
+    runs.sort(key=lambda item: item.get("run_at") or "")
+    del runs[:-limit]
+
+
+def merge_dead_letter_fragments(dead_letters: dict, fragments: list[dict]) -> None:
+    """Each fragment carries the complete remaining dead letters of its shard."""
+    for fragment in fragments:
+        if "dead_letters" not in fragment:
+            continue
+        shard = parse_shard(fragment["shard"])
+        for key in list(dead_letters_for_shard(dead_letters, shard)):
+            del dead_letters[key]
+        dead_letters.update(fragment["dead_letters"])
+
+
+def merge_shard_files(state_file: str, fragment_files: list[str], dead_letter_file: str | None = None) -> None:
+    state, _ = load_state(state_file)
+    fragments = []
+    for fragment_file in fragment_files:
+        with open(fragment_file, "r", encoding="utf-8") as file:
+            fragments.append(json.load(file))
+    added = merge_state_fragments(state, fragments)
+    save_state(state_file, state)
+    if dead_letter_file and any("dead_letters" in fragment for fragment in fragments):
+        dead_letters = load_dead_letters(dead_letter_file)
+        merge_dead_letter_fragments(dead_letters, fragments)
+        if dead_letters or Path(dead_letter_file).exists():
+            save_dead_letters(dead_letter_file, dead_letters)
+    shards = ", ".join(str(fragment.get("shard", "?")) for fragment in fragments)
+    print(f"Merged {len(fragments)} shard fragments ({shards}). Newly seen comments: {added}")
+
+
+def persist_run_state(
+    state_file: str,
+    state: dict,
+    shard: tuple[int, int] | None,
+    new_keys: list[str],
+    activity: dict,
+    record_sweep: bool,
+    dead_letter_file: str | None = None,
+    dead_letters: dict | None = None,
+    freshness_run: dict | None = None,
+    threads: dict | None = None,
+) -> None:
+    """Save the full state, or only this run's delta as a shard fragment."""
+    if shard is None:
+        if freshness_run:
+            record_freshness_run(state, freshness_run)
+        save_state(state_file, state)
+        if dead_letter_file and (dead_letters or Path(dead_letter_file).exists()):
+            save_dead_letters(dead_letter_file, dead_letters or {})
+        return
+    fragment_file = shard_fragment_path(state_file, shard)
+    last_full_sweep = state.get("last_full_sweep") if record_sweep else None
+    fragment = build_state_fragment(
+        shard, state["seen"], new_keys, activity, last_full_sweep, dead_letters, freshness_run, threads
+    )
+    save_state(fragment_file, fragment)
+    print(f"Wrote shard state fragment: {fragment_file}")
+
+
+def load_dead_letters(dead_letter_file: str) -> dict:
+    path = Path(dead_letter_file)
+    if not path.exists() or path.stat().st_size == 0:
+        return {}
+    with path.open("r", encoding="utf-8") as file:
+        payload = json.load(file)
+    entries = payload.get("entries", {}) if isinstance(payload, dict) else {}
+    return entries if isinstance(entries, dict) else {}
+
+
+def save_dead_letters(dead_letter_file: str, dead_letters: dict) -> None:
+    save_state(dead_letter_file, {"version": 1, "entries": dead_letters})
+
+
+def dead_letters_for_shard(dead_letters: dict, shard: tuple[int, int]) -> dict:
+    shard_index, shard_count = shard
+    return {
+        key: entry
+        for key, entry in dead_letters.items()
+        if assignment_shard(entry["event"].get("assignment_id"), shard_count) == shard_index
+    }
+
+
+def add_dead_letter(dead_letters: dict, event: dict, failed_at: str) -> None:
+    """Queue a failed post with everything needed to re-render it, but never the webhook URL."""
+    entry = dead_letters.get(event["key"])
+    if entry is None:
+        stored_event = {field: event.get(field) for field in DEAD_LETTER_EVENT_FIELDS}
+        entry = {"event": stored_event, "attempts": 0, "first_failed_at": failed_at}
+        dead_letters[event["key"]] = entry
+    entry["attempts"] += 1
+    entry["last_failed_at"] = failed_at
+
+
+def expire_dead_letters(
+    dead_letters: dict,
+    now: datetime,
+    max_attempts: int,
+    max_age_hours: float,
+) -> list[dict]:
+    expired = []
+    for key, entry in list(dead_letters.items()):
+        first_failed_at = parse_timestamp(entry.get("first_failed_at"))
+        too_old = first_failed_at is not None and now - first_failed_at > timedelta(hours=max_age_hours)
+        if too_old or entry.get("attempts", 0) >= max_attempts:
+            expired.append(dead_letters.pop(key))
+    return expired
+
+
+def mark_seen(seen: dict, event: dict, saved_at: str, **extra) -> None:
+    seen[event["key"]] = {
+        "created_at": event.get("created_at"),
+        "assignment_id": event.get("assignment_id"),
+        "author_id": event.get("author_id"),
+        "saved_at": saved_at,
+        **({"change": event["change"]} if event.get("change") else {}),
+        **extra,
+    }
+
+
 def normalize_text(value: str | None) -> str:
     if value is None:
         return ""
@@ -84,6 +345,93 @@ def is_truthy(value: str | None) -> bool:
     return value.strip().lower() in {"1", "true", "yes", "on"}
 
 
+def utc_now_iso() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def parse_timestamp(value) -> datetime | None:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def is_full_sweep_due(state: dict, now: datetime, interval_hours: float) -> bool:
+    last_sweep = parse_timestamp(state.get("last_full_sweep"))
+    if last_sweep is None:
+        return True
+    return now - last_sweep >= timedelta(hours=interval_hours)
+
+
+def assignment_prune_reason(
+    assignment,
+    record: dict | None,
+    now: datetime,
+    dormant_days: float = DEFAULT_DORMANT_DAYS,
+) -> str | None:
+    """Return why an assignment can be skipped this run, or None to crawl it.
+
+    Rules are conservative: anything the metadata cannot rule out is crawled,
+    and the periodic full sweep catches whatever the rules get wrong.
+    """
+    if getattr(assignment, "published", True) is False:
+        return "unpublished"
+
+    # Students can comment before submitting (e.g. to ask for an extension), so an
+    # assignment nobody submitted to is only skipped once it closed a while ago.
+    has_activity = bool(record and record.get("last_activity"))
+    closed_at = parse_timestamp(getattr(assignment, "lock_at", None) or getattr(assignment, "due_at", None))
+    if (
+        getattr(assignment, "has_submitted_submissions", True) is False
+        and not has_activity
+        and closed_at is not None
+        and now - closed_at >= timedelta(days=dormant_days)
+    ):
+        return "no_submissions"
+
+    if record is None:
+        return None
+    if (getattr(assignment, "needs_grading_count", 0) or 0) > 0:
+        return None
+    if getattr(assignment, "updated_at", None) != record.get("updated_at"):
+        return None
+
+    lock_at = parse_timestamp(getattr(assignment, "lock_at", None))
+    if lock_at is None or lock_at > now:
+        return None
+
+    last_activity = parse_timestamp(record.get("last_activity"))
+    if last_activity is not None and now - last_activity < timedelta(days=dormant_days):
+        return None
+    return "closed_inactive"
+
+
+def prune_assignments(
+    assignments,
+    records: dict,
+    now: datetime,
+    full_sweep: bool = False,
+    dormant_days: float = DEFAULT_DORMANT_DAYS,
+) -> tuple[list, dict[str, int]]:
+    selected = []
+    pruned: dict[str, int] = {}
+    for assignment in assignments:
+        reason = None
+        if not full_sweep:
+            record = records.get(str(getattr(assignment, "id", None)))
+            reason = assignment_prune_reason(assignment, record, now, dormant_days)
+        if reason is None:
+            selected.append(assignment)
+        else:
+            pruned[reason] = pruned.get(reason, 0) + 1
+    return selected, pruned
+
+
 def make_comment_key(
     course_id: int,
     assignment_id: int | None,
@@ -92,6 +440,19 @@ def make_comment_key(
 ) -> str:
     comment_id = comment.get("id")
     if comment_id is not None:
+        if (
+            type(comment_id) is int
+            and type(course_id) is int
+            and (assignment_id is None or type(assignment_id) is int)
+            and (submission_user_id is None or type(submission_user_id) is int)
+        ):
+            # Fast path for integer IDs: byte-identical to the json.dumps canonical form below.
+            payload = (
+                f'{{"assignment_id":{"null" if assignment_id is None else assignment_id},'
+                f'"comment_id":{comment_id},"course_id":{course_id},'
+                f'"submission_user_id":{"null" if submission_user_id is None else submission_user_id}}}'
+            )
+            return hashlib.sha256(payload.encode("utf-8")).hexdigest()
         canonical = {
             "course_id": course_id,
             "assignment_id": assignment_id,
@@ -111,22 +472,213 @@ def make_comment_key(
     return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
 
+def comment_fingerprint(comment: dict) -> str:
+    """Short digest of a comment's visible text; 64 bits is plenty to notice an edit."""
+    return hashlib.sha256(normalize_text(comment.get("comment")).encode("utf-8")).hexdigest()[:16]
+
+
+def make_change_key(comment_key: str, change: str, fingerprint: str | None = None) -> str:
+    """Dedupe key for an edit/deletion notification; each distinct edit gets its own key."""
+    payload = f"{comment_key}:{change}:{fingerprint or ''}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def update_comment_threads(stored: dict, fetched: dict) -> bool:
+    """Replace the fingerprints of re-fetched assignments; returns whether anything changed.
+
+    Both map assignment ID -> submission user ID -> comment ID -> fingerprint.
+    Assignments without student comments are dropped to keep the state small.
+    """
+    changed = False
+    for assignment_id, threads in fetched.items():
+        if stored.get(assignment_id, {}) == threads:
+            continue
+        changed = True
+        if threads:
+            stored[assignment_id] = threads
+        else:
+            stored.pop(assignment_id, None)
+    return changed
+
+
+def diff_comment_threads(
+    stored: dict, fetched: dict, comment_ids: dict
+) -> list[tuple[str, str, str, str, str | None]]:
+    """Find edited and deleted comments in re-fetched assignments only.
+
+    Returns `(change, assignment_id, submission_user_id, comment_id, fingerprint)`
+    tuples. Unchanged threads are skipped with a single dict comparison, and
+    comments that are new to a thread are left to the regular new-comment path.
+    A comment only counts as deleted when its ID is missing from `comment_ids`
+    (every comment Canvas returned, by any author), so a student dropped from
+    the group mapping doesn't make their comments look deleted.
+    """
+    changes = []
+    for assignment_id, threads in fetched.items():
+        present = comment_ids.get(assignment_id, {})
+        for user_id, old_comments in (stored.get(assignment_id) or {}).items():
+            new_comments = threads.get(user_id, {})
+            if new_comments == old_comments:
+                continue
+            for comment_id, old_fingerprint in old_comments.items():
+                new_fingerprint = new_comments.get(comment_id)
+                if new_fingerprint is None:
+                    if comment_id not in present.get(user_id, ()):
+                        changes.append(("deleted", assignment_id, user_id, comment_id, None))
+                elif new_fingerprint != old_fingerprint:
+                    changes.append(("edited", assignment_id, user_id, comment_id, new_fingerprint))
+    return changes
+
+
+def build_change_events(
+    changes: list[tuple[str, str, str, str, str | None]],
+    candidates: list[dict],
+    seen: dict,
+    course,
+    assignments,
+    group_map: dict[str, str],
+) -> list[dict]:
+    """Turn diff results into notifier events; deletions are rebuilt from the seen entry."""
+    by_comment = {
+        (str(event["assignment_id"]), str(event["submission_user_id"]), str(event["comment"].get("id"))): event
+        for event in candidates
+    }
+    assignments_by_id = {str(getattr(assignment, "id", None)): assignment for assignment in assignments}
+    events = []
+    for change, assignment_id, user_id, comment_id, fingerprint in changes:
+        ids = [int(value) if value.isdigit() else value for value in (assignment_id, user_id, comment_id)]
+        comment_key = make_comment_key(course.id, ids[0], ids[1], {"id": ids[2]})
+        current = by_comment.get((assignment_id, user_id, comment_id))
+        if current is not None:
+            event = dict(current)
+        else:
+            entry = seen.get(comment_key, {})
+            author_id = entry.get("author_id")
+            assignment = assignments_by_id.get(assignment_id)
+            event = {
+                "course_id": getattr(course, "id", None),
+                "course_name": getattr(course, "name", "Unknown course"),
+                "assignment_id": ids[0],
+                "assignment_name": getattr(assignment, "name", f"Assignment {assignment_id}"),
+                "assignment_url": getattr(assignment, "html_url", None),
+                "assignment_due_at": getattr(assignment, "due_at", None),
+                "submission_user_id": ids[1],
+                "author_id": author_id,
+                "author_name": f"User {author_id}" if author_id is not None else "Unknown author",
+                "group_name": group_map.get(str(author_id), "No Group"),
+                "created_at": entry.get("created_at"),
+                "comment_text": "",
+                "comment": {"id": ids[2]},
+            }
+        event["change"] = change
+        event["key"] = make_change_key(comment_key, change, fingerprint)
+        events.append(event)
+    return events
+
+
+def comment_title(event: dict) -> str:
+    return COMMENT_CHANGE_TITLES.get(event.get("change"), COMMENT_CHANGE_TITLES[None])
+
+
 def build_teams_text(event: dict) -> str:
+    comment_text = event['comment_text'] or "(empty)"
+    if event.get("change") == "deleted":
+        comment_text = "(deleted in Canvas)"
     lines = [
-        "New Canvas student comment",
+        comment_title(event),
         f"Course: {event['course_name']} (ID: {event['course_id']})",
         f"Assignment: {event['assignment_name']} (ID: {event['assignment_id']})",
         f"Author: {event['author_name']} (ID: {event['author_id']})",
         f"Group: {event['group_name']}",
         f"Created: {event['created_at'] or 'unknown'}",
         "Comment:",
-        event['comment_text'] or "(empty)",
+        comment_text,
     ]
     if event.get("assignment_url"):
         lines.append(f"Assignment link: {event['assignment_url']}")
     return "\n".join(lines)
 
 
+def build_digest_line(event: dict, max_comment_length: int = 200) -> str:
+    comment_text = normalize_text(event.get("comment_text")) or "(empty)"
+    if len(comment_text) > max_comment_length:
+        comment_text = comment_text[: max_comment_length - 1] + "…"
+    if event.get("change") == "deleted":
+        comment_text = "(deleted in Canvas)"
+    marker = f"[{event['change']}] " if event.get("change") else ""
+    return (
+        f"- {marker}{event.get('created_at') or 'unknown'} | {event.get('group_name')} | "
+        f"{event.get('author_name')} | {event.get('assignment_name')}: {comment_text}"
+    )
+
+
+def build_digest_text(events: list[dict], max_comment_length: int = 200) -> str:
+    lines = [f"{DIGEST_TITLE} ({len(events)} comments)"]
+    lines.extend(build_digest_line(event, max_comment_length) for event in events)
+    return "\n".join(lines)
+
+
+def split_digest(
+    events: list[dict],
+    max_bytes: int = DEFAULT_DIGEST_MAX_BYTES,
+    max_events: int = DEFAULT_DIGEST_MAX_EVENTS,
+) -> list[list[dict]]:
+    """Split digest events into batches whose text stays under `max_bytes` once JSON-encoded for the webhook."""
+    batches: list[list[dict]] = []
+    batch: list[dict] = []
+    size = 0
+    for event in events:
+        line_size = len(json.dumps(build_digest_line(event))) + 1
+        if batch and (size + line_size > max_bytes or len(batch) >= max_events):
+            batches.append(batch)
+            batch, size = [], 0
+        batch.append(event)
+        size += line_size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def load_priority_rules(rules_file: str | None = None) -> dict:
+    """Merge a JSON rules file over `DEFAULT_PRIORITY_RULES`; group patterns like `A01-A10` are expanded."""
+    rules = dict(DEFAULT_PRIORITY_RULES)
+    if rules_file:
+        with open(rules_file, "r", encoding="utf-8") as file:
+            overrides = json.load(file)
+        if not isinstance(overrides, dict):
+            raise ValueError("Priority rules file must contain a JSON object")
+        unknown = set(overrides) - set(DEFAULT_PRIORITY_RULES)
+        if unknown:
+            raise ValueError(f"Unknown priority rules: {', '.join(sorted(unknown))}")
+        rules.update(overrides)
+    rules["groups"] = {name for pattern in rules["groups"] for name in expand_group_pattern(pattern)}
+    rules["keywords"] = [keyword.lower() for keyword in rules["keywords"]]
+    return rules
+
+
+def score_event(event: dict, rules: dict, now: datetime) -> float:
+    """Higher scores are delivered first."""
+    score = 0.0
+    created_at = parse_timestamp(event.get("created_at"))
+    if created_at is not None:
+        age_hours = max((now - created_at).total_seconds() / 3600, 0.0)
+        score += rules["recency_weight"] * 0.5 ** (age_hours / rules["recency_half_life_hours"])
+
+    due_at = parse_timestamp(event.get("assignment_due_at"))
+    if due_at is not None:
+        hours_from_due = abs((due_at - now).total_seconds()) / 3600
+        if hours_from_due < rules["due_soon_hours"]:
+            score += rules["due_soon_weight"] * (1 - hours_from_due / rules["due_soon_hours"])
+
+    if event.get("group_name") in rules["groups"]:
+        score += rules["group_weight"]
+
+    comment_text = (event.get("comment_text") or "").lower()
+    if any(keyword in comment_text for keyword in rules["keywords"]):
+        score += rules["keyword_weight"]
+    return score
+
+
 def resolve_teams_webhook_mode(webhook_url: str, mode_override: str | None = None) -> str:
     mode = (mode_override or "auto").strip().lower()
     aliases = {
@@ -166,16 +718,16 @@ def resolve_teams_webhook_mode(webhook_url: str, mode_override: str | None = Non
     return "messagecard"
 
 
-def build_messagecard_payload(text: str) -> dict:
+def build_messagecard_payload(text: str, title: str | None = None) -> dict:
     return {
         "@type": "MessageCard",
         "@context": "https://schema.org/extensions",
-        "summary": "Canvas student comment",
+        "summary": title or "Canvas student comment",
         "text": text,
     }
 
 
-def build_adaptive_card_payload(text: str) -> dict:
+def build_adaptive_card_payload(text: str, title: str | None = None) -> dict:
     return {
         "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
         "type": "AdaptiveCard",
@@ -183,7 +735,7 @@ def build_adaptive_card_payload(text: str) -> dict:
         "body": [
             {
                 "type": "TextBlock",
-                "text": "New Canvas student comment",
+                "text": title or COMMENT_CHANGE_TITLES[None],
                 "weight": "Bolder",
                 "size": "Medium",
             },
@@ -196,11 +748,13 @@ def build_adaptive_card_payload(text: str) -> dict:
     }
 
 
-def build_teams_payload(webhook_url: str, text: str, payload_mode: str | None = None) -> dict:
+def build_teams_payload(
+    webhook_url: str, text: str, payload_mode: str | None = None, title: str | None = None
+) -> dict:
     mode = resolve_teams_webhook_mode(webhook_url, payload_mode)
     if mode == "adaptivecard":
-        return build_adaptive_card_payload(text)
-    return build_messagecard_payload(text)
+        return build_adaptive_card_payload(text, title)
+    return build_messagecard_payload(text, title)
 
 
 def post_to_teams(
@@ -209,8 +763,9 @@ def post_to_teams(
     timeout_seconds: int = 20,
     max_retries: int = 3,
     payload_mode: str | None = None,
+    title: str | None = None,
 ) -> bool:
-    payload = build_teams_payload(webhook_url, text, payload_mode)
+    payload = build_teams_payload(webhook_url, text, payload_mode, title)
     request = url_request.Request(
         webhook_url,
         data=json.dumps(payload).encode("utf-8"),
@@ -240,12 +795,290 @@ def post_to_teams(
     return False
 
 
-def collect_candidate_events(course, group_map: dict[str, str]) -> list[dict]:
+def resolve_webhook_reference(value: str) -> str:
+    """Route targets are webhook URLs or `env:NAME` so secrets can stay out of the routing file."""
+    value = str(value).strip()
+    if value.startswith("env:"):
+        return require_env(value[len("env:"):])
+    return value
+
+
+def expand_group_pattern(pattern: str) -> list[str]:
+    """Expand `A01-A10` into `A01`..`A10`; anything else is a single group name."""
+    match = re.fullmatch(r"([^\d-]*)(\d+)-(?:\1)?(\d+)", pattern.strip())
+    if not match:
+        return [pattern.strip()]
+    prefix, start, end = match.groups()
+    width = len(start)
+    return [f"{prefix}{number:0{width}d}" for number in range(int(start), int(end) + 1)]
+
+
+def load_routes(routing_file: str | None, default_webhook_url: str | None) -> dict:
+    """Build the routing table: assignment routes win over group routes, which win over the default.
+
+    The routing file is JSON, for example:
+        {"default": "env:TEAMS_WEBHOOK_URL",
+         "groups": {"A01-A10": "env:TEAMS_WEBHOOK_TA1"},
+         "assignments": {"146386": "env:TEAMS_WEBHOOK_REPORT"}}
+    """
+    config = {}
+    if routing_file:
+        with open(routing_file, "r", encoding="utf-8") as file:
+            config = json.load(file)
+        if not isinstance(config, dict):
+            raise ValueError("Routing file must contain a JSON object")
+
+    routes = {"default": None, "groups": {}, "assignments": {}, "labels": {}}
+    if config.get("default"):
+        routes["default"] = resolve_webhook_reference(config["default"])
+    elif default_webhook_url:
+        routes["default"] = default_webhook_url
+    if not routes["default"]:
+        raise ValueError("Missing required environment variable: TEAMS_WEBHOOK_URL (or a default route)")
+    routes["labels"][routes["default"]] = "default"
+
+    for pattern, target in (config.get("groups") or {}).items():
+        url = resolve_webhook_reference(target)
+        routes["labels"].setdefault(url, f"groups {pattern}")
+        for group_name in expand_group_pattern(pattern):
+            routes["groups"][group_name] = url
+    for assignment_id, target in (config.get("assignments") or {}).items():
+        url = resolve_webhook_reference(target)
+        routes["labels"].setdefault(url, f"assignment {assignment_id}")
+        routes["assignments"][str(assignment_id)] = url
+    return routes
+
+
+def resolve_route(event: dict, routes: dict) -> str:
+    assignment_route = routes["assignments"].get(str(event.get("assignment_id")))
+    if assignment_route:
+        return assignment_route
+    group_route = routes["groups"].get(event.get("group_name"))
+    if group_route:
+        return group_route
+    return routes["default"]
+
+
+class DeliveryPool:
+    """One priority queue and worker thread per webhook, so a throttled channel doesn't hold up the others.
+
+    Workers post the highest-priority event first. Once `deadline` (a
+    `time.monotonic()` value) has passed, the remaining events of a destination
+    are posted as digests through `send_digest`, split to fit the webhook size
+    limit; each digest succeeds or fails on its own.
+    """
+
+    _STOP = object()
+
+    def __init__(self, send, route, priority=None, deadline: float | None = None, send_digest=None):
+        self._send = send
+        self._route = route
+        self._priority = priority
+        self._deadline = deadline
+        self._send_digest = send_digest
+        self._queues: dict[str, queue.PriorityQueue] = {}
+        self._workers: list[threading.Thread] = []
+        self._results: queue.Queue = queue.Queue()
+        self._sequence = itertools.count()
+        self._submitted = 0
+
+    def submit(self, event: dict) -> None:
+        destination = self._route(event)
+        destination_queue = self._queues.get(destination)
+        if destination_queue is None:
+            destination_queue = queue.PriorityQueue()
+            self._queues[destination] = destination_queue
+            worker = threading.Thread(
+                target=self._work, args=(destination, destination_queue), daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+        rank = -self._priority(event) if self._priority else 0
+        destination_queue.put((rank, next(self._sequence), event))
+        self._submitted += 1
+
+    def _past_deadline(self) -> bool:
+        return (
+            self._deadline is not None
+            and self._send_digest is not None
+            and time.monotonic() >= self._deadline
+        )
+
+    def _work(self, destination: str, destination_queue: queue.PriorityQueue) -> None:
+        deferred = []
+        while True:
+            _, _, event = destination_queue.get()
+            if event is self._STOP:
+                break
+            if self._past_deadline():
+                deferred.append(event)
+                continue
+            try:
+                success = self._send(destination, event)
+            except Exception as exc:
+                print(f"Delivery failed: {exc}")
+                success = False
+            self._results.put((destination, event, success))
+
+        for batch in split_digest(deferred):
+            try:
+                success = self._send_digest(destination, batch)
+            except Exception as exc:
+                print(f"Digest delivery failed: {exc}")
+                success = False
+            for event in batch:
+                event["digested"] = True
+                self._results.put((destination, event, success))
+
+    def results(self):
+        """Yield (destination, event, success) as deliveries finish; call after the last submit."""
+        for destination_queue in self._queues.values():
+            destination_queue.put((math.inf, next(self._sequence), self._STOP))
+        for _ in range(self._submitted):
+            yield self._results.get()
+        self._submitted = 0
+        for worker in self._workers:
+            worker.join()
+        self._queues.clear()
+        self._workers.clear()
+
+
+def deliver_events(
+    events: list[dict],
+    routes: dict,
+    send,
+    seen: dict,
+    dead_letters: dict,
+    new_keys: list[str],
+    priority=None,
+    deadline: float | None = None,
+    send_digest=None,
+) -> tuple[int, dict[str, list[int]]]:
+    """Post events through per-destination workers; failures go to the dead-letter queue.
+
+    Returns the number sent and `[sent, failed, digested]` counts per destination label.
+    """
+    pool = DeliveryPool(
+        send,
+        lambda event: resolve_route(event, routes),
+        priority=priority,
+        deadline=deadline,
+        send_digest=send_digest,
+    )
+    if priority is not None:
+        # Submit in priority order too, so a worker that starts early already picks the top event.
+        events = sorted(events, key=priority, reverse=True)
+    for event in events:
+        pool.submit(event)
+
+    sent = 0
+    per_destination: dict[str, list[int]] = {}
+    for destination, event, success in pool.results():
+        counts = per_destination.setdefault(routes["labels"].get(destination, "unknown"), [0, 0, 0])
+        if not success:
+            counts[1] += 1
+            add_dead_letter(dead_letters, event, utc_now_iso())
+            continue
+        counts[0] += 1
+        if event.get("digested"):
+            counts[2] += 1
+        dead_letters.pop(event["key"], None)
+        delivered_at = utc_now_iso()
+        mark_seen(seen, event, delivered_at, delivered_at=delivered_at)
+        new_keys.append(event["key"])
+        sent += 1
+    return sent, per_destination
+
+
+def retry_dead_letters(
+    dead_letters: dict,
+    routes: dict,
+    send,
+    seen: dict,
+    new_keys: list[str],
+    max_attempts: int = DEFAULT_DEAD_LETTER_MAX_ATTEMPTS,
+    max_age_hours: float = DEFAULT_DEAD_LETTER_MAX_AGE_HOURS,
+) -> tuple[int, int, int]:
+    """Re-post queued failures without touching Canvas; returns (sent, still failing, expired).
+
+    Expired entries are marked seen with `dropped_at` so the next crawl doesn't
+    rediscover and re-queue them.
+    """
+    dropped_at = utc_now_iso()
+    expired = expire_dead_letters(dead_letters, datetime.now(timezone.utc), max_attempts, max_age_hours)
+    for entry in expired:
+        mark_seen(seen, entry["event"], dropped_at, dropped_at=dropped_at)
+        new_keys.append(entry["event"]["key"])
+
+    events = [dict(entry["event"]) for entry in dead_letters.values()]
+    sent, _ = deliver_events(events, routes, send, seen, dead_letters, new_keys)
+    return sent, len(events) - sent, len(expired)
+
+
+def retry_dead_letter_files(
+    state_file: str,
+    dead_letter_file: str,
+    routes: dict,
+    send,
+    max_attempts: int = DEFAULT_DEAD_LETTER_MAX_ATTEMPTS,
+    max_age_hours: float = DEFAULT_DEAD_LETTER_MAX_AGE_HOURS,
+) -> tuple[int, int, int]:
+    """One pass of `--retry-dead-letters` that is safe next to scheduled runs.
+
+    Both files are re-read for every pass and again right before writing, and
+    only the seen and dead-letter keys this pass touched are written back, so
+    whatever a notifier run saved in the meantime is kept.
+    """
+    snapshot = load_dead_letters(dead_letter_file)
+    if not snapshot:
+        return 0, 0, 0
+    remaining = {key: dict(entry) for key, entry in snapshot.items()}
+    retried_seen: dict = {}
+    sent, failed, expired = retry_dead_letters(
+        remaining, routes, send, retried_seen, [], max_attempts, max_age_hours
+    )
+
+    state, _ = load_state(state_file)
+    state["seen"].update(retried_seen)
+    save_state(state_file, state)
+
+    dead_letters = load_dead_letters(dead_letter_file)
+    for key in snapshot:
+        if key not in remaining:
+            dead_letters.pop(key, None)
+        elif key in dead_letters:
+            # A run may have delivered it meanwhile; only update entries still queued.
+            dead_letters[key] = remaining[key]
+    save_dead_letters(dead_letter_file, dead_letters)
+    return sent, failed, expired
+
+
+def collect_candidate_events(
+    course,
+    group_map: dict[str, str],
+    assignments=None,
+    activity: dict | None = None,
+    threads: dict | None = None,
+    thread_comments: dict | None = None,
+    comment_ids: dict | None = None,
+) -> list[dict]:
+    """Collect student comments as notifier events.
+
+    With `threads`, the content fingerprint of every student comment is recorded
+    per assignment and submission, and `comment_ids` gets the IDs of all their
+    comments, whoever wrote them (see `diff_comment_threads`). With
+    `thread_comments`, every comment of every fetched submission, staff
+    included, is listed per `assignment_id:user_id` thread (see engagement.py).
+    """
     events = []
-    for assignment in course.get_assignments():
+    if assignments is None:
+        assignments = course.get_assignments()
+
+    for assignment in assignments:
         assignment_id = getattr(assignment, "id", None)
         assignment_name = getattr(assignment, "name", f"Assignment {assignment_id}")
         assignment_url = getattr(assignment, "html_url", None)
+        assignment_due_at = getattr(assignment, "due_at", None)
 
         try:
             submissions = assignment.get_submissions(include=["submission_comments", "user"])
@@ -253,11 +1086,32 @@ def collect_candidate_events(course, group_map: dict[str, str]) -> list[dict]:
             print(f"Failed to fetch submissions for assignment {assignment_id}: {exc}")
             continue
 
+        assignment_threads = None
+        if threads is not None:
+            assignment_threads = threads.setdefault(str(assignment_id), {})
+        assignment_comment_ids = None
+        if comment_ids is not None:
+            assignment_comment_ids = comment_ids.setdefault(str(assignment_id), {})
+
+        last_activity = None
         for submission in submissions:
             submission_user_id = getattr(submission, "user_id", None)
             comments = getattr(submission, "submission_comments", None) or []
+            if assignment_comment_ids is not None:
+                assignment_comment_ids[str(submission_user_id)] = {
+                    str(comment["id"]) for comment in comments if comment.get("id") is not None
+                }
+            if thread_comments is not None and comments:
+                thread_comments[f"{assignment_id}:{submission_user_id}"] = [
+                    {"id": comment.get("id"), "author_id": comment.get("author_id"), "created_at": comment.get("created_at")}
+                    for comment in comments
+                ]
 
             for comment in comments:
+                created_at = comment.get("created_at")
+                if created_at and (last_activity is None or created_at > last_activity):
+                    last_activity = created_at
+
                 author_id = comment.get("author_id")
                 if author_id is None:
                     continue
@@ -266,6 +1120,11 @@ def collect_candidate_events(course, group_map: dict[str, str]) -> list[dict]:
                 if author_key not in group_map:
                     continue
 
+                if assignment_threads is not None and comment.get("id") is not None:
+                    assignment_threads.setdefault(str(submission_user_id), {})[str(comment["id"])] = (
+                        comment_fingerprint(comment)
+                    )
+
                 events.append(
                     {
                         "course_id": getattr(course, "id", None),
@@ -273,6 +1132,7 @@ def collect_candidate_events(course, group_map: dict[str, str]) -> list[dict]:
                         "assignment_id": assignment_id,
                         "assignment_name": assignment_name,
                         "assignment_url": assignment_url,
+                        "assignment_due_at": assignment_due_at,
                         "submission_user_id": submission_user_id,
                         "author_id": author_id,
                         "author_name": comment.get("author_name") or f"User {author_id}",
@@ -283,33 +1143,203 @@ def collect_candidate_events(course, group_map: dict[str, str]) -> list[dict]:
                     }
                 )
 
+        if activity is not None:
+            activity[str(assignment_id)] = {
+                "last_activity": last_activity,
+                "updated_at": getattr(assignment, "updated_at", None),
+            }
+
     events.sort(key=lambda item: item.get("created_at") or "")
     return events
 
 
-def main() -> None:
-    api_base = os.getenv("CANVAS_API_BASE", DEFAULT_API_BASE).strip() or DEFAULT_API_BASE
-    course_id = int(require_env("CANVAS_COURSE_ID"))
-    webhook_url = require_env("TEAMS_WEBHOOK_URL")
-    groups_file = os.getenv("STUDENT_GROUPS_FILE", DEFAULT_GROUPS_FILE)
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Post new student submission comments to Teams.")
+    parser.add_argument(
+        "--source",
+        choices=["live", "mirror"],
+        default=os.getenv("CANVAS_SOURCE", "live").strip().lower() or "live",
+        help="Read from Canvas (live) or from the local SQLite mirror (see canvas_mirror.py)",
+    )
+    parser.add_argument("--mirror", default=None, help="Mirror file when --source=mirror")
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        default=os.getenv("NOTIFIER_SHARD", "").strip() or None,
+        help="Only handle assignments in shard i of n (e.g. 2/4); writes a state fragment",
+    )
+    parser.add_argument(
+        "--retry-dead-letters",
+        action="store_true",
+        help="Only retry queued failed Teams posts (no Canvas requests), then exit",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=float(os.getenv("DEAD_LETTER_RETRY_INTERVAL", "0") or 0),
+        help="With --retry-dead-letters, keep running and retry every INTERVAL seconds",
+    )
+    parser.add_argument(
+        "--merge-shards",
+        nargs="+",
+        metavar="FRAGMENT",
+        help="Merge shard state fragments into STATE_FILE and exit (no Canvas or Teams calls)",
+    )
+    return parser.parse_args(argv)
+
+
+def open_canvas(source: str, api_base: str, mirror_file: str | None = None):
+    if source == "mirror":
+        import canvas_mirror
+
+        return canvas_mirror.open_mirror_canvas(mirror_file)
+    return Canvas(api_base, get_canvas_token())
+
+
+def archive_events(archive_file: str, events: list[dict]) -> None:
+    import comment_archive
+
+    conn = comment_archive.connect_archive(archive_file)
+    try:
+        changed = comment_archive.add_events(conn, events)
+    finally:
+        conn.close()
+    print(f"Comment archive: {changed} comments added or updated")
+
+
+def main(argv: list[str] | None = None, open_live_canvas=None) -> None:
+    """Run the notifier; `open_live_canvas` lets a caller share an already configured live client.
+
+    It is only called when the run actually reads from live Canvas.
+    """
+    args = parse_args([] if argv is None else argv)
     state_file = os.getenv("STATE_FILE", DEFAULT_STATE_FILE)
+    dead_letter_file = os.getenv("DEAD_LETTER_FILE", DEFAULT_DEAD_LETTER_FILE)
+    if args.merge_shards:
+        merge_shard_files(state_file, args.merge_shards, dead_letter_file)
+        return
+
+    api_base = get_api_base()
+    webhook_url = os.getenv("TEAMS_WEBHOOK_URL", "").strip()
+    routing_file = os.getenv("ROUTING_FILE", "").strip()
+    groups_file = os.getenv("STUDENT_GROUPS_FILE", DEFAULT_GROUPS_FILE)
     first_run_behavior = os.getenv("FIRST_RUN_BEHAVIOR", "baseline").strip().lower()
     dry_run = is_truthy(os.getenv("DRY_RUN"))
     webhook_mode = os.getenv("TEAMS_WEBHOOK_MODE", "auto").strip().lower()
+    force_full_sweep = is_truthy(os.getenv("FULL_SWEEP"))
+    full_sweep_hours = float(os.getenv("FULL_SWEEP_INTERVAL_HOURS", DEFAULT_FULL_SWEEP_HOURS))
+    dormant_days = float(os.getenv("DORMANT_ASSIGNMENT_DAYS", DEFAULT_DORMANT_DAYS))
+    archive_file = os.getenv("COMMENT_ARCHIVE_FILE", "").strip()
+    priority_rules_file = os.getenv("PRIORITY_RULES_FILE", "").strip()
+    time_budget_seconds = float(os.getenv("DELIVERY_TIME_BUDGET_SECONDS", "0") or 0)
+    dead_letter_max_attempts = int(os.getenv("DEAD_LETTER_MAX_ATTEMPTS", DEFAULT_DEAD_LETTER_MAX_ATTEMPTS))
+    dead_letter_max_age_hours = float(
+        os.getenv("DEAD_LETTER_MAX_AGE_HOURS", DEFAULT_DEAD_LETTER_MAX_AGE_HOURS)
+    )
+    notify_changes = is_truthy(os.getenv("NOTIFY_COMMENT_CHANGES"))
+    freshness_slo_seconds = float(os.getenv("FRESHNESS_SLO_SECONDS", "0") or 0) or None
+    freshness_slo_percentile = float(os.getenv("FRESHNESS_SLO_PERCENTILE", "95") or 95)
+    engagement_file = os.getenv("ENGAGEMENT_FILE", "").strip()
 
-    token = get_canvas_token()
-    group_map = load_groups(groups_file)
+    routes = load_routes(routing_file, webhook_url)
+    priority_rules = load_priority_rules(priority_rules_file)
     state, state_exists = load_state(state_file)
     seen = state.get("seen", {})
+    dead_letters = load_dead_letters(dead_letter_file)
+    if args.shard:
+        dead_letters = dead_letters_for_shard(dead_letters, args.shard)
+
+    def send(destination: str, event: dict) -> bool:
+        return post_to_teams(
+            destination, build_teams_text(event), payload_mode=webhook_mode, title=comment_title(event)
+        )
+
+    if args.retry_dead_letters:
+        if args.shard:
+            raise ValueError("--retry-dead-letters works on the whole queue and can't be combined with --shard")
+        while True:
+            sent, failed, expired = retry_dead_letter_files(
+                state_file, dead_letter_file, routes, send, dead_letter_max_attempts, dead_letter_max_age_hours
+            )
+            print(f"Dead letters: re-sent {sent}, still failing {failed}, expired {expired}")
+            if args.interval <= 0:
+                return
+            time.sleep(args.interval)
 
-    canvas = Canvas(api_base, token)
+    course_id = int(require_env("CANVAS_COURSE_ID"))
+    group_map = load_groups(groups_file)
+    new_keys = []
+    dead_letters_changed = False
+    if dead_letters and dry_run:
+        print(f"DRY_RUN enabled. {len(dead_letters)} dead letters would be retried.")
+    elif dead_letters:
+        sent, failed, expired = retry_dead_letters(
+            dead_letters, routes, send, seen, new_keys, dead_letter_max_attempts, dead_letter_max_age_hours
+        )
+        dead_letters_changed = True
+        print(f"Dead letters: re-sent {sent}, still failing {failed}, expired {expired}")
+
+    if open_live_canvas is None or args.source == "mirror":
+        canvas = open_canvas(args.source, api_base, args.mirror)
+    else:
+        canvas = open_live_canvas()
     current_user = canvas.get_current_user()
     course = canvas.get_course(course_id)
     print(f"Canvas user: {current_user.name} ({current_user.id})")
     print(f"Course: {course.name} ({course.id})")
-    print(f"Webhook payload mode: {resolve_teams_webhook_mode(webhook_url, webhook_mode)}")
+    for url, label in routes["labels"].items():
+        print(f"Webhook '{label}' payload mode: {resolve_teams_webhook_mode(url, webhook_mode)}")
+    if args.source == "mirror":
+        print("Source: local mirror")
+    if args.shard:
+        print(f"Shard: {args.shard[0]}/{args.shard[1]}")
+
+    now = datetime.now(timezone.utc)
+    records = state.setdefault("assignments", {})
+    full_sweep = force_full_sweep or is_full_sweep_due(state, now, full_sweep_hours)
+    # Mirror reads are local, so pruning buys nothing; don't let them count as a live sweep either.
+    record_sweep = full_sweep and args.source == "live"
+    full_sweep = full_sweep or args.source == "mirror"
+    all_assignments = list(course.get_assignments())
+    if args.shard:
+        shard_index, shard_count = args.shard
+        all_assignments = [
+            assignment
+            for assignment in all_assignments
+            if assignment_shard(getattr(assignment, "id", None), shard_count) == shard_index
+        ]
+    selected, pruned = prune_assignments(all_assignments, records, now, full_sweep, dormant_days)
+    pruned_summary = ", ".join(f"{reason}: {count}" for reason, count in sorted(pruned.items()))
+    print(
+        f"Assignments: {len(all_assignments)} | Crawled: {len(selected)} | "
+        f"Pruned: {len(all_assignments) - len(selected)}"
+        + (f" ({pruned_summary})" if pruned_summary else "")
+        + (" | Full sweep" if full_sweep else "")
+    )
+
+    activity: dict[str, dict] = {}
+    threads = {} if notify_changes else None
+    comment_ids = {} if notify_changes else None
+    # Parallel shards would race on the aggregates file; a lone 1/1 shard can't.
+    parallel_shards = bool(args.shard) and args.shard[1] > 1
+    thread_comments = {} if engagement_file and not parallel_shards else None
+    if engagement_file and parallel_shards:
+        print("Engagement aggregates are not updated when the crawl is split over several shards")
+    candidates = collect_candidate_events(
+        course,
+        group_map,
+        assignments=selected,
+        activity=activity,
+        threads=threads,
+        thread_comments=thread_comments,
+        comment_ids=comment_ids,
+    )
+    records_changed = any(records.get(key) != value for key, value in activity.items())
+    records.update(activity)
+    if record_sweep:
+        state["last_full_sweep"] = utc_now_iso()
+        records_changed = True
 
-    candidates = collect_candidate_events(course, group_map)
     unseen = []
     for event in candidates:
         key = make_comment_key(
@@ -319,7 +1349,8 @@ def main() -> None:
             comment=event["comment"],
         )
         event["key"] = key
-        if key not in seen:
+        # Dead letters are already queued for delivery; don't post them twice.
+        if key not in seen and key not in dead_letters:
             unseen.append(event)
 
     already_seen_count = len(candidates) - len(unseen)
@@ -328,6 +1359,28 @@ def main() -> None:
         f"New: {len(unseen)} | Already seen: {already_seen_count}"
     )
 
+    change_events = []
+    if threads is not None:
+        stored_threads = state.setdefault("threads", {})
+        changes = diff_comment_threads(stored_threads, threads, comment_ids)
+        change_events = [
+            event
+            for event in build_change_events(changes, candidates, seen, course, selected, group_map)
+            if event["key"] not in seen and event["key"] not in dead_letters
+        ]
+        records_changed = update_comment_threads(stored_threads, threads) or records_changed
+        edited = sum(1 for event in change_events if event["change"] == "edited")
+        print(f"Comment changes: {edited} edited, {len(change_events) - edited} deleted")
+        unseen.extend(change_events)
+
+    if archive_file and not dry_run:
+        archive_events(archive_file, candidates)
+    if thread_comments is not None and not dry_run:
+        import engagement
+
+        processed = engagement.update_engagement_file(engagement_file, thread_comments, group_map)
+        print(f"Engagement aggregates: {processed} new comments")
+
     if dry_run:
         print(f"DRY_RUN enabled. {len(unseen)} comments would be sent to Teams.")
         for event in unseen:
@@ -335,46 +1388,100 @@ def main() -> None:
                 f"- {event.get('created_at') or 'unknown'} | "
                 f"{event.get('assignment_name')} | "
                 f"{event.get('author_name')}"
+                + (f" ({event['change']})" if event.get("change") else "")
             )
         return
 
     if not state_exists and first_run_behavior == "baseline":
-        now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        saved_at = utc_now_iso()
         for event in unseen:
-            seen[event["key"]] = {
-                "created_at": event.get("created_at"),
-                "assignment_id": event.get("assignment_id"),
-                "author_id": event.get("author_id"),
-                "saved_at": now,
-            }
-        save_state(state_file, state)
+            mark_seen(seen, event, saved_at)
+            new_keys.append(event["key"])
+        persist_run_state(
+            state_file,
+            state,
+            args.shard,
+            new_keys,
+            activity,
+            record_sweep,
+            dead_letter_file,
+            dead_letters,
+            threads=threads,
+        )
         print(f"First run baseline complete. Added {len(unseen)} existing comments to state.")
         return
 
-    sent = 0
-    for event in unseen:
-        text = build_teams_text(event)
-        success = post_to_teams(webhook_url, text, payload_mode=webhook_mode)
-        if not success:
-            continue
+    def send_digest(destination: str, events: list[dict]) -> bool:
+        return post_to_teams(
+            destination, build_digest_text(events), payload_mode=webhook_mode, title=DIGEST_TITLE
+        )
 
-        seen[event["key"]] = {
-            "created_at": event.get("created_at"),
-            "assignment_id": event.get("assignment_id"),
-            "author_id": event.get("author_id"),
-            "saved_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-        }
-        sent += 1
+    scored_at = datetime.now(timezone.utc)
+    # The budget covers delivery only, so a slow crawl doesn't push everything into digests.
+    delivery_started = time.monotonic()
+    dead_letters_before = len(dead_letters)
+    sent, per_destination = deliver_events(
+        unseen,
+        routes,
+        send,
+        seen,
+        dead_letters,
+        new_keys,
+        priority=lambda event: score_event(event, priority_rules, scored_at),
+        deadline=delivery_started + time_budget_seconds if time_budget_seconds > 0 else None,
+        send_digest=send_digest,
+    )
+    dead_letters_changed = dead_letters_changed or len(dead_letters) != dead_letters_before
 
-    if sent > 0 or (not state_exists and not unseen):
-        save_state(state_file, state)
+    import freshness
+
+    freshness_run = freshness.run_summary(
+        seen, new_keys, utc_now_iso(), freshness_slo_seconds, freshness_slo_percentile
+    )
+    if not freshness_run["delivered"]:
+        freshness_run = None
+
+    if (
+        args.shard
+        or new_keys
+        or records_changed
+        or dead_letters_changed
+        or (not state_exists and not unseen)
+    ):
+        persist_run_state(
+            state_file,
+            state,
+            args.shard,
+            new_keys,
+            activity,
+            record_sweep,
+            dead_letter_file,
+            dead_letters,
+            freshness_run,
+            threads,
+        )
 
-    print(f"Detected {len(unseen)} new student comments. Sent {sent} to Teams.")
+    for label, (label_sent, label_failed, label_digested) in sorted(per_destination.items()):
+        print(
+            f"- {label}: sent {label_sent}, failed {label_failed}"
+            + (f" ({label_digested} in digest after time budget)" if label_digested else "")
+        )
+    if dead_letters:
+        print(f"Dead letters pending retry: {len(dead_letters)}")
+    if freshness_run:
+        print(freshness.format_summary(freshness_run))
+        if freshness_run.get("slo", {}).get("violated"):
+            print("Warning: freshness SLO violated this run")
+    print(
+        f"Detected {len(unseen) - len(change_events)} new student comments"
+        + (f" and {len(change_events)} edits/deletions" if change_events else "")
+        + f". Sent {sent} to Teams."
+    )
 
 
 if __name__ == "__main__":
     try:
-        main()
+        main(sys.argv[1:])
     except Exception as exc:
         print(exc)
         sys.exit(1)
\ No newline at end of file
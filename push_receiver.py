@@ -0,0 +1,583 @@
+"""
+Push receiver for new submission comments, as an alternative to polling Canvas.
+
+Canvas Live Events (through a relay that signs the body) post
+`submission_comment_created` events here. Each event is verified, mapped to a
+student group, deduplicated with the notifier's comment keys and posted through
+the same Teams delivery path. Polling is only kept as a periodic reconciliation
+crawl that picks up anything the push feed missed:
+
+    PUSH_SHARED_SECRET=... uv run push_receiver.py serve --port 8080 --reconcile-interval 3600
+
+`produce` is a local stand-in producer that posts a signed event:
+
+    PUSH_SHARED_SECRET=... uv run push_receiver.py produce --submission 123 --comment-id 456 --author 789 --comment "Hi"
+"""
+
+import argparse
+import copy
+from datetime import datetime, timezone
+import hashlib
+import hmac
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+from pathlib import Path
+import queue
+import sys
+import threading
+from urllib import error as url_error
+from urllib import request as url_request
+
+import freshness
+import notify_course_comments as notifier
+
+sys.stdout.reconfigure(line_buffering=True)
+
+EVENT_NAME = "submission_comment_created"
+SIGNATURE_HEADER = "X-CanvasChirp-Signature"
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_PATH = "/events"
+DEFAULT_RECONCILE_SECONDS = 3600
+MAX_BODY_BYTES = 1024 * 1024
+# Live Events use global IDs (shard * 10**13 + local ID); the REST API and the state use local IDs.
+GLOBAL_ID_SHARD_FACTOR = 10**13
+
+
+def sign_payload(secret: str, body: bytes) -> str:
+    return "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(secret: str, body: bytes, signature: str | None) -> bool:
+    if not signature:
+        return False
+    return hmac.compare_digest(sign_payload(secret, body), signature.strip())
+
+
+def local_id(value) -> int | None:
+    if value is None or value == "":
+        return None
+    return int(value) % GLOBAL_ID_SHARD_FACTOR
+
+
+def parse_notification(payload: dict) -> dict:
+    """Flatten a Live Events envelope ({"metadata": ..., "body": ...}) into the fields we use.
+
+    Relays may add `assignment_id`, `submission_user_id` and `user_name` to the
+    body; otherwise the submission is looked up in the mirror.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("Event must be a JSON object")
+    metadata = payload.get("metadata") or {}
+    body = payload.get("body") or {}
+    event_name = metadata.get("event_name") or payload.get("event_name")
+    if event_name != EVENT_NAME:
+        raise ValueError(f"Unsupported event: {event_name}")
+
+    course_id = None
+    if (metadata.get("context_type") or "Course") == "Course":
+        course_id = local_id(metadata.get("context_id"))
+    return {
+        "course_id": course_id,
+        "comment_id": local_id(body.get("submission_comment_id")),
+        "submission_id": local_id(body.get("submission_id")),
+        "assignment_id": local_id(body.get("assignment_id")),
+        "submission_user_id": local_id(body.get("submission_user_id")),
+        "author_id": local_id(body.get("user_id") or metadata.get("user_id")),
+        "author_name": body.get("user_name") or metadata.get("user_login"),
+        "created_at": body.get("created_at") or metadata.get("event_time"),
+        "comment_text": body.get("body") or "",
+    }
+
+
+class MirrorLookup:
+    """Resolves submission IDs and assignment details from the local mirror, one connection per thread."""
+
+    def __init__(self, mirror_file: str):
+        if not Path(mirror_file).exists():
+            raise FileNotFoundError(f"Mirror not found at {mirror_file}; run `canvas_mirror.py sync` first")
+        self.mirror_file = mirror_file
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            import canvas_mirror
+
+            conn = canvas_mirror.connect_mirror(self.mirror_file)
+            self._local.conn = conn
+        return conn
+
+    def submission(self, submission_id: int) -> tuple[int, int, str | None] | None:
+        row = self._conn().execute(
+            "SELECT assignment_id, user_id, user_name FROM submissions WHERE id = ?", (submission_id,)
+        ).fetchone()
+        return (row["assignment_id"], row["user_id"], row["user_name"]) if row else None
+
+    def assignment(self, assignment_id: int) -> dict | None:
+        row = self._conn().execute(
+            "SELECT name, html_url, due_at FROM assignments WHERE id = ?", (assignment_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+
+class PushReceiver:
+    """Shared state between the HTTP handlers, the delivery thread and reconciliation.
+
+    Handlers only verify, dedupe and queue events; a single delivery thread posts
+    them in batches through `notifier.deliver_events` and persists the state.
+    """
+
+    def __init__(
+        self,
+        course_id: int,
+        group_map: dict[str, str],
+        routes: dict,
+        send,
+        state_file: str,
+        dead_letter_file: str,
+        secret: str,
+        lookup: MirrorLookup | None = None,
+        priority=None,
+        batch_window: float = 0.5,
+        reconcile: bool = True,
+    ):
+        if not secret:
+            raise ValueError("Missing required environment variable: PUSH_SHARED_SECRET")
+        self.course_id = course_id
+        self.course_name = f"Course {course_id}"
+        self.group_map = group_map
+        self.routes = routes
+        self.send = send
+        self.state_file = state_file
+        self.dead_letter_file = dead_letter_file
+        self.secret = secret
+        self.lookup = lookup
+        self.priority = priority
+        self.batch_window = batch_window
+        self.reconcile_enabled = reconcile
+        self.state, self.state_exists = notifier.load_state(state_file)
+        self.seen = self.state["seen"]
+        self.dead_letters = notifier.load_dead_letters(dead_letter_file)
+        self.assignment_info: dict[int, dict] = {}
+        self.stats = {"received": 0, "queued": 0, "duplicate": 0, "ignored": 0, "unresolved": 0, "sent": 0, "failed": 0}
+        self._lock = threading.Lock()
+        self._pending: set[str] = set()
+        self._inbox: queue.Queue = queue.Queue()
+        self._stopped = threading.Event()
+
+    def build_event(self, notification: dict) -> tuple[dict | None, str]:
+        """Turn a parsed notification into a notifier event; returns (event, outcome)."""
+        if notification["course_id"] not in (None, self.course_id):
+            return None, "ignored"
+        author_id = notification["author_id"]
+        if author_id is None or str(author_id) not in self.group_map:
+            return None, "ignored"
+        if notification["comment_id"] is None:
+            return None, "unresolved"
+
+        assignment_id = notification["assignment_id"]
+        submission_user_id = notification["submission_user_id"]
+        submission_user_name = None
+        if (assignment_id is None or submission_user_id is None) and self.lookup and notification["submission_id"]:
+            resolved = self.lookup.submission(notification["submission_id"])
+            if resolved:
+                assignment_id, submission_user_id, submission_user_name = resolved
+        if assignment_id is None or submission_user_id is None:
+            # Reconciliation will pick the comment up with full details.
+            return None, "unresolved"
+
+        info = self.assignment_info.get(assignment_id)
+        if info is None and self.lookup:
+            info = self.lookup.assignment(assignment_id)
+        info = info or {}
+        author_name = notification["author_name"]
+        if not author_name and author_id == submission_user_id:
+            author_name = submission_user_name
+        event = {
+            "course_id": self.course_id,
+            "course_name": self.course_name,
+            "assignment_id": assignment_id,
+            "assignment_name": info.get("name") or f"Assignment {assignment_id}",
+            "assignment_url": info.get("html_url"),
+            "assignment_due_at": info.get("due_at"),
+            "submission_user_id": submission_user_id,
+            "author_id": author_id,
+            "author_name": author_name or f"User {author_id}",
+            "group_name": self.group_map.get(str(author_id), "No Group"),
+            "created_at": notification["created_at"],
+            "comment_text": notification["comment_text"],
+            "comment": {"id": notification["comment_id"], "author_id": author_id},
+        }
+        return event, "queued"
+
+    def ingest(self, events: list[dict]) -> tuple[int, int]:
+        """Queue events that are neither seen, dead-lettered nor already queued; returns (queued, duplicates)."""
+        queued = duplicates = 0
+        with self._lock:
+            for event in events:
+                key = notifier.make_comment_key(
+                    course_id=self.course_id,
+                    assignment_id=event.get("assignment_id"),
+                    submission_user_id=event.get("submission_user_id"),
+                    comment=event["comment"],
+                )
+                event["key"] = key
+                if key in self.seen or key in self.dead_letters or key in self._pending:
+                    duplicates += 1
+                    continue
+                self._pending.add(key)
+                self._inbox.put(event)
+                queued += 1
+        return queued, duplicates
+
+    def receive(self, body: bytes, signature: str | None) -> tuple[int, dict]:
+        """Handle one POST body; returns the HTTP status and a JSON-able summary."""
+        if not verify_signature(self.secret, body, signature):
+            return 401, {"error": "invalid signature"}
+        try:
+            payload = json.loads(body)
+            notifications = [parse_notification(item) for item in (payload if isinstance(payload, list) else [payload])]
+        except (ValueError, TypeError) as exc:
+            return 400, {"error": str(exc)}
+
+        outcome = {"queued": 0, "duplicate": 0, "ignored": 0, "unresolved": 0}
+        events = []
+        for notification in notifications:
+            event, result = self.build_event(notification)
+            if event is None:
+                outcome[result] += 1
+                if result == "unresolved":
+                    print(
+                        f"Unresolved push: comment {notification['comment_id']}, submission "
+                        f"{notification['submission_id']}"
+                        + ("; left for reconciliation" if self.reconcile_enabled else "; rejected")
+                    )
+            else:
+                events.append(event)
+        outcome["queued"], outcome["duplicate"] = self.ingest(events)
+        with self._lock:
+            self.stats["received"] += len(notifications)
+            for name, count in outcome.items():
+                self.stats[name] += count
+        if outcome["unresolved"] and not self.reconcile_enabled:
+            # Nothing would pick these comments up later, so make the sender retry or alert.
+            return 422, {**outcome, "error": "unresolved comments and reconciliation is disabled"}
+        return 202, outcome
+
+    def deliver_pending(self, timeout: float | None = None) -> int:
+        """Post one batch of queued events and persist the result; returns the number posted."""
+        try:
+            batch = [self._inbox.get(timeout=timeout)]
+        except queue.Empty:
+            return 0
+        # Give a burst of pushes a moment to arrive so they share one delivery round.
+        if self.batch_window > 0:
+            self._stopped.wait(self.batch_window)
+        while True:
+            try:
+                batch.append(self._inbox.get_nowait())
+            except queue.Empty:
+                break
+
+        batch_seen: dict = {}
+        batch_dead_letters: dict = {}
+        new_keys: list[str] = []
+        sent, _ = notifier.deliver_events(
+            batch, self.routes, self.send, batch_seen, batch_dead_letters, new_keys, priority=self.priority
+        )
+        run = freshness.run_summary(batch_seen, new_keys, notifier.utc_now_iso())
+        with self._lock:
+            self.seen.update(batch_seen)
+            self.dead_letters.update(batch_dead_letters)
+            self._pending.difference_update(event["key"] for event in batch)
+            self.stats["sent"] += sent
+            self.stats["failed"] += len(batch) - sent
+            if run["delivered"]:
+                notifier.record_freshness_run(self.state, run)
+            self._persist()
+        print(f"Delivered {sent} of {len(batch)} pushed comments")
+        return sent
+
+    def _persist(self) -> None:
+        notifier.save_state(self.state_file, self.state)
+        if self.dead_letters or Path(self.dead_letter_file).exists():
+            notifier.save_dead_letters(self.dead_letter_file, self.dead_letters)
+
+    def retry_dead_letters(self, max_attempts: int, max_age_hours: float) -> tuple[int, int, int]:
+        # Retry a snapshot so handlers aren't blocked while Teams is slow.
+        with self._lock:
+            snapshot = copy.deepcopy(self.dead_letters)
+        retried_keys = set(snapshot)
+        retry_seen: dict = {}
+        sent, failed, expired = notifier.retry_dead_letters(
+            snapshot, self.routes, self.send, retry_seen, [], max_attempts, max_age_hours
+        )
+        with self._lock:
+            for key in retried_keys - set(snapshot):
+                self.dead_letters.pop(key, None)
+            self.dead_letters.update(snapshot)
+            self.seen.update(retry_seen)
+            if retried_keys:
+                self._persist()
+        return sent, failed, expired
+
+    def reconcile(self, course, full_sweep_hours: float, dormant_days: float, baseline: bool = False) -> int:
+        """Poll Canvas once and queue anything the push feed missed; returns the number queued.
+
+        With `baseline`, existing comments are stored as seen instead (first run).
+        """
+        now = datetime.now(timezone.utc)
+        self.course_name = getattr(course, "name", self.course_name)
+        all_assignments = list(course.get_assignments())
+        for assignment in all_assignments:
+            self.assignment_info[getattr(assignment, "id", None)] = {
+                "name": getattr(assignment, "name", None),
+                "html_url": getattr(assignment, "html_url", None),
+                "due_at": getattr(assignment, "due_at", None),
+            }
+
+        records = self.state.setdefault("assignments", {})
+        full_sweep = notifier.is_full_sweep_due(self.state, now, full_sweep_hours)
+        selected, _ = notifier.prune_assignments(all_assignments, records, now, full_sweep, dormant_days)
+        activity: dict[str, dict] = {}
+        candidates = notifier.collect_candidate_events(course, self.group_map, assignments=selected, activity=activity)
+
+        if baseline:
+            saved_at = notifier.utc_now_iso()
+            with self._lock:
+                for event in candidates:
+                    event["key"] = notifier.make_comment_key(
+                        self.course_id, event.get("assignment_id"), event.get("submission_user_id"), event["comment"]
+                    )
+                    if event["key"] not in self.seen:
+                        notifier.mark_seen(self.seen, event, saved_at)
+            queued = 0
+        else:
+            queued, _ = self.ingest(candidates)
+
+        with self._lock:
+            records.update(activity)
+            if full_sweep:
+                self.state["last_full_sweep"] = notifier.utc_now_iso()
+            self.state_exists = True
+            self._persist()
+        print(
+            f"Reconciliation: crawled {len(selected)} of {len(all_assignments)} assignments | "
+            f"Candidates: {len(candidates)} | Queued: {queued}" + (" | Baseline" if baseline else "")
+        )
+        return queued
+
+    def run_delivery(self) -> None:
+        while not self._stopped.is_set():
+            self.deliver_pending(timeout=1.0)
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+
+def make_server(receiver: PushReceiver, host: str, port: int, path: str = DEFAULT_PATH) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status: int, payload: dict) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path != "/healthz":
+                self._reply(404, {"error": "not found"})
+                return
+            with receiver._lock:
+                stats = dict(receiver.stats)
+                stats["pending"] = len(receiver._pending)
+                stats["dead_letters"] = len(receiver.dead_letters)
+            self._reply(200, stats)
+
+        def do_POST(self):
+            if self.path != path:
+                self._reply(404, {"error": "not found"})
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY_BYTES:
+                self._reply(413, {"error": "payload too large"})
+                return
+            status, payload = receiver.receive(self.rfile.read(length), self.headers.get(SIGNATURE_HEADER))
+            self._reply(status, payload)
+
+        def log_message(self, format, *args):
+            print(f"{self.address_string()} - {format % args}")
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def post_event(url: str, secret: str, payload, timeout_seconds: int = 10) -> tuple[int, dict]:
+    body = json.dumps(payload).encode("utf-8")
+    request = url_request.Request(
+        url,
+        data=body,
+        headers={"Content-Type": "application/json", SIGNATURE_HEADER: sign_payload(secret, body)},
+        method="POST",
+    )
+    try:
+        with url_request.urlopen(request, timeout=timeout_seconds) as response:
+            return response.getcode(), json.loads(response.read() or b"{}")
+    except url_error.HTTPError as exc:
+        return exc.code, json.loads(exc.read() or b"{}")
+
+
+def build_live_event(
+    course_id: int,
+    submission_id: int,
+    comment_id: int,
+    author_id: int,
+    comment: str,
+    created_at: str | None = None,
+    **extra,
+) -> dict:
+    """A `submission_comment_created` envelope in the Live Events shape."""
+    return {
+        "metadata": {
+            "event_name": EVENT_NAME,
+            "context_type": "Course",
+            "context_id": str(course_id),
+            "user_id": str(author_id),
+            "event_time": created_at or notifier.utc_now_iso(),
+        },
+        "body": {
+            "submission_comment_id": str(comment_id),
+            "submission_id": str(submission_id),
+            "user_id": str(author_id),
+            "created_at": created_at or notifier.utc_now_iso(),
+            "body": comment,
+            **{name: str(value) if isinstance(value, int) else value for name, value in extra.items()},
+        },
+    }
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Receive pushed Canvas comment events and post them to Teams.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Run the receiver")
+    serve.add_argument("--host", default=os.getenv("PUSH_HOST", DEFAULT_HOST))
+    serve.add_argument("--port", type=int, default=int(os.getenv("PUSH_PORT", DEFAULT_PORT)))
+    serve.add_argument("--path", default=os.getenv("PUSH_PATH", DEFAULT_PATH))
+    serve.add_argument(
+        "--reconcile-interval",
+        type=float,
+        default=float(os.getenv("PUSH_RECONCILE_INTERVAL", DEFAULT_RECONCILE_SECONDS)),
+        help="Seconds between reconciliation crawls; 0 disables polling",
+    )
+    serve.add_argument("--source", choices=["live", "mirror"], default=os.getenv("CANVAS_SOURCE", "live") or "live")
+    serve.add_argument(
+        "--mirror",
+        default=os.getenv("CANVAS_MIRROR_FILE", ""),
+        help="Mirror used to resolve submission IDs and assignment names",
+    )
+
+    produce = commands.add_parser("produce", help="Post a signed test event to a running receiver")
+    produce.add_argument("--url", default=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}{DEFAULT_PATH}")
+    produce.add_argument("--course", type=int, default=os.getenv("CANVAS_COURSE_ID"))
+    produce.add_argument("--submission", type=int, required=True)
+    produce.add_argument("--comment-id", type=int, required=True)
+    produce.add_argument("--author", type=int, required=True)
+    produce.add_argument("--comment", default="Test comment")
+    produce.add_argument("--assignment", type=int, help="Include the assignment ID (skips the mirror lookup)")
+    produce.add_argument("--submission-user", type=int, help="Include the submission's user ID")
+    return parser.parse_args(argv)
+
+
+def serve(args: argparse.Namespace) -> None:
+    state_file = os.getenv("STATE_FILE", notifier.DEFAULT_STATE_FILE)
+    dead_letter_file = os.getenv("DEAD_LETTER_FILE", notifier.DEFAULT_DEAD_LETTER_FILE)
+    api_base = notifier.get_api_base()
+    webhook_mode = os.getenv("TEAMS_WEBHOOK_MODE", "auto").strip().lower()
+    first_run_behavior = os.getenv("FIRST_RUN_BEHAVIOR", "baseline").strip().lower()
+    full_sweep_hours = float(os.getenv("FULL_SWEEP_INTERVAL_HOURS", notifier.DEFAULT_FULL_SWEEP_HOURS))
+    dormant_days = float(os.getenv("DORMANT_ASSIGNMENT_DAYS", notifier.DEFAULT_DORMANT_DAYS))
+    dead_letter_max_attempts = int(os.getenv("DEAD_LETTER_MAX_ATTEMPTS", notifier.DEFAULT_DEAD_LETTER_MAX_ATTEMPTS))
+    dead_letter_max_age_hours = float(
+        os.getenv("DEAD_LETTER_MAX_AGE_HOURS", notifier.DEFAULT_DEAD_LETTER_MAX_AGE_HOURS)
+    )
+    course_id = int(notifier.require_env("CANVAS_COURSE_ID"))
+    routes = notifier.load_routes(os.getenv("ROUTING_FILE", "").strip(), os.getenv("TEAMS_WEBHOOK_URL", "").strip())
+    priority_rules = notifier.load_priority_rules(os.getenv("PRIORITY_RULES_FILE", "").strip())
+
+    def send(destination: str, event: dict) -> bool:
+        return notifier.post_to_teams(
+            destination,
+            notifier.build_teams_text(event),
+            payload_mode=webhook_mode,
+            title=notifier.comment_title(event),
+        )
+
+    receiver = PushReceiver(
+        course_id,
+        notifier.load_groups(os.getenv("STUDENT_GROUPS_FILE", notifier.DEFAULT_GROUPS_FILE)),
+        routes,
+        send,
+        state_file,
+        dead_letter_file,
+        os.getenv("PUSH_SHARED_SECRET", "").strip(),
+        lookup=MirrorLookup(args.mirror) if args.mirror else None,
+        priority=lambda event: notifier.score_event(event, priority_rules, datetime.now(timezone.utc)),
+        reconcile=args.reconcile_interval > 0,
+    )
+
+    def reconcile_loop() -> None:
+        canvas = notifier.open_canvas(args.source, api_base, args.mirror or None)
+        while True:
+            try:
+                sent, failed, expired = receiver.retry_dead_letters(dead_letter_max_attempts, dead_letter_max_age_hours)
+                if sent or failed or expired:
+                    print(f"Dead letters: re-sent {sent}, still failing {failed}, expired {expired}")
+                baseline = not receiver.state_exists and first_run_behavior == "baseline"
+                receiver.reconcile(canvas.get_course(course_id), full_sweep_hours, dormant_days, baseline=baseline)
+            except Exception as exc:
+                print(f"Reconciliation failed: {exc}")
+            if receiver._stopped.wait(args.reconcile_interval):
+                return
+
+    threading.Thread(target=receiver.run_delivery, daemon=True).start()
+    if args.reconcile_interval > 0:
+        threading.Thread(target=reconcile_loop, daemon=True).start()
+
+    server = make_server(receiver, args.host, args.port, args.path)
+    print(f"Listening on http://{args.host}:{server.server_port}{args.path} for course {course_id}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        receiver.stop()
+        server.server_close()
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args([] if argv is None else argv)
+    if args.command == "serve":
+        serve(args)
+        return
+
+    if args.course is None:
+        raise ValueError("Missing course: pass --course or set CANVAS_COURSE_ID")
+    extra = {}
+    if args.assignment is not None:
+        extra["assignment_id"] = args.assignment
+    if args.submission_user is not None:
+        extra["submission_user_id"] = args.submission_user
+    payload = build_live_event(int(args.course), args.submission, args.comment_id, args.author, args.comment, **extra)
+    status, response = post_event(args.url, notifier.require_env("PUSH_SHARED_SECRET"), payload)
+    print(f"HTTP {status}: {json.dumps(response)}")
+
+
+if __name__ == "__main__":
+    try:
+        main(sys.argv[1:])
+    except Exception as exc:
+        print(exc)
+        sys.exit(1)
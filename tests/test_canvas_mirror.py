@@ -0,0 +1,123 @@
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+import canvas_mirror as mirror
+import notify_course_comments as notifier
+
+
+def make_assignment(assignment_id, submissions, **metadata):
+    defaults = {
+        "name": f"Assignment {assignment_id}",
+        "html_url": f"https://canvas.example/assignments/{assignment_id}",
+        "published": True,
+        "has_submitted_submissions": True,
+        "needs_grading_count": 0,
+        "updated_at": "2026-01-01T00:00:00Z",
+        "lock_at": None,
+    }
+    defaults.update(metadata)
+    assignment = SimpleNamespace(id=assignment_id, **defaults)
+    assignment.get_submissions = lambda **kwargs: list(submissions)
+    return assignment
+
+
+def make_canvas(assignments):
+    course = SimpleNamespace(id=1, name="Algorithms", get_assignments=lambda **kwargs: list(assignments))
+    return SimpleNamespace(
+        get_current_user=lambda: SimpleNamespace(id=99, name="Tester"),
+        get_course=lambda course_id: course,
+    )
+
+
+class TestCanvasMirror(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.conn = mirror.connect_mirror(str(Path(self.temp_dir.name) / "mirror.sqlite3"))
+        self.now = datetime(2026, 3, 1, tzinfo=timezone.utc)
+
+    def tearDown(self):
+        self.conn.close()
+        self.temp_dir.cleanup()
+
+    def test_sync_then_query_by_assignment_author_group_and_time(self):
+        submission = SimpleNamespace(
+            id=500,
+            user_id=10,
+            user=SimpleNamespace(name="Student A"),
+            submission_comments=[
+                {"id": 1, "author_id": 10, "author_name": "Student A", "created_at": "2026-02-01T10:00:00Z", "comment": "Question"},
+                {"id": 2, "author_id": 77, "author_name": "TA", "created_at": "2026-02-02T10:00:00Z", "comment": "Answer"},
+            ],
+        )
+        canvas = make_canvas([make_assignment(7, [submission]), make_assignment(8, [])])
+        mirror.sync_groups(self.conn, {"10": "A01"})
+
+        stats = mirror.sync_course(self.conn, canvas, 1, now=self.now)
+
+        self.assertTrue(stats["full_sweep"])
+        self.assertEqual(stats["comments"], 2)
+        self.assertEqual(len(mirror.query_comments(self.conn, assignment_id=7)), 2)
+        self.assertEqual([row["comment"] for row in mirror.query_comments(self.conn, author_id=77)], ["Answer"])
+        by_group = mirror.query_comments(self.conn, group="A01")
+        self.assertEqual([row["comment_id"] for row in by_group], [1])
+        self.assertEqual(by_group[0]["group_name"], "A01")
+        self.assertEqual(
+            [row["comment_id"] for row in mirror.query_comments(self.conn, since="2026-02-02T00:00:00Z")],
+            [2],
+        )
+
+    def test_recrawl_replaces_deleted_comments(self):
+        comments = [
+            {"id": 1, "author_id": 10, "created_at": "2026-02-01T10:00:00Z", "comment": "First"},
+            {"id": 2, "author_id": 10, "created_at": "2026-02-02T10:00:00Z", "comment": "Second"},
+        ]
+        submission = SimpleNamespace(id=500, user_id=10, submission_comments=comments)
+        canvas = make_canvas([make_assignment(7, [submission])])
+        mirror.sync_course(self.conn, canvas, 1, now=self.now)
+
+        comments.pop(0)
+        mirror.sync_course(self.conn, canvas, 1, full_sweep=True, now=self.now)
+
+        self.assertEqual([row["comment_id"] for row in mirror.query_comments(self.conn)], [2])
+
+    def test_incremental_sync_prunes_unpublished_assignments(self):
+        canvas = make_canvas([make_assignment(7, []), make_assignment(8, [], published=False)])
+        mirror.sync_course(self.conn, canvas, 1, now=self.now)
+
+        stats = mirror.sync_course(self.conn, canvas, 1, now=self.now)
+
+        self.assertFalse(stats["full_sweep"])
+        self.assertEqual(stats["pruned"], {"unpublished": 1})
+
+    def test_mirror_canvas_matches_live_shapes_for_collect_candidate_events(self):
+        submission = SimpleNamespace(
+            id=500,
+            user_id=10,
+            user=SimpleNamespace(name="Student A"),
+            submission_comments=[
+                {"id": 1, "author_id": 10, "author_name": "Student A", "created_at": "2026-02-01T10:00:00Z", "comment": "Hi"},
+            ],
+        )
+        live_canvas = make_canvas([make_assignment(7, [submission])])
+        mirror.sync_course(self.conn, live_canvas, 1, now=self.now)
+
+        canvas = mirror.MirrorCanvas(self.conn)
+        course = canvas.get_course(1)
+        events = notifier.collect_candidate_events(course, {"10": "A01"})
+
+        self.assertEqual(canvas.get_current_user().name, "Tester")
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]["assignment_name"], "Assignment 7")
+        self.assertEqual(
+            notifier.make_comment_key(1, 7, 10, events[0]["comment"]),
+            notifier.make_comment_key(1, 7, 10, submission.submission_comments[0]),
+        )
+        with self.assertRaises(mirror.ResourceDoesNotExist):
+            course.get_assignment(12345)
+
+
+if __name__ == "__main__":
+    unittest.main()
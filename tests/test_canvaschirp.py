@@ -0,0 +1,107 @@
+import json
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import canvaschirp
+
+
+class CountingHandler(BaseHTTPRequestHandler):
+    hits = []
+
+    def _reply(self):
+        CountingHandler.hits.append((self.command, self.path))
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _reply
+    do_POST = _reply
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestCanvasChirp(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), CountingHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        CountingHandler.hits.clear()
+
+    def test_caching_session_answers_repeated_gets_from_memory(self):
+        session = canvaschirp.CachingSession(ttl=60)
+        headers = {"Authorization": "Bearer x"}
+        for _ in range(3):
+            self.assertEqual(session.get(f"{self.base}/a", headers=headers, params=[("page", "1")]).json(), {"ok": True})
+        session.get(f"{self.base}/a", headers=headers, params=[("page", "2")])
+        session.post(f"{self.base}/a", headers=headers)
+        session.post(f"{self.base}/a", headers=headers)
+
+        self.assertEqual(len(CountingHandler.hits), 4)
+        self.assertEqual(session.stats, {"requests": 4, "cache_hits": 2})
+
+    def test_zero_ttl_disables_the_cache(self):
+        session = canvaschirp.CachingSession(ttl=0)
+        session.get(f"{self.base}/a")
+        session.get(f"{self.base}/a")
+        self.assertEqual(len(CountingHandler.hits), 2)
+
+    def test_canvas_client_uses_the_shared_session(self):
+        ctx = canvaschirp.ChirpContext(self.base)
+        with patch.dict("os.environ", {"CANVAS_TOKEN": "x"}):
+            canvas = ctx.canvas
+        self.assertIs(canvas._Canvas__requester._session, ctx.http)
+        self.assertIs(ctx.canvas, canvas)
+
+    def test_offline_commands_need_no_canvas_token(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            state_file = str(Path(temp_dir) / "state.json")
+            fragment = Path(temp_dir) / "fragment.json"
+            fragment.write_text(json.dumps({"version": 1, "shard": "1/1", "seen": {"k": {}}, "assignments": {}}), encoding="utf-8")
+            env = {
+                "CANVAS_TOKEN": "",
+                "CANVAS_TOKEN_FILE": str(Path(temp_dir) / "missing-token"),
+                "CANVAS_API_BASE": self.base,
+                "STATE_FILE": state_file,
+                "DEAD_LETTER_FILE": str(Path(temp_dir) / "dead_letters.json"),
+            }
+            with patch.dict("os.environ", env):
+                canvaschirp.main(["mirror", "--mirror", str(Path(temp_dir) / "mirror.sqlite3"), "query"])
+                canvaschirp.main(["notify", "--merge-shards", str(fragment)])
+                with self.assertRaises(FileNotFoundError):
+                    canvaschirp.main(["notifications"])
+
+            with open(state_file, "r", encoding="utf-8") as file:
+                self.assertIn("k", json.load(file)["seen"])
+
+    def test_batch_runs_operations_in_order_in_one_context(self):
+        calls = []
+        ctx = canvaschirp.ChirpContext(self.base)
+        with patch.object(canvaschirp, "run_comments", lambda c, args: calls.append(("comments", c, args.assignment))), \
+                patch.object(canvaschirp, "run_notify", lambda c, args: calls.append(("notify", c, args.args))):
+            args = canvaschirp.parse_command(canvaschirp.build_parser(), ["batch", "comments --assignment 9", "notify --source mirror"])
+            args.handler(ctx, args)
+
+        self.assertEqual(calls, [("comments", ctx, 9), ("notify", ctx, ["--source", "mirror"])])
+        with self.assertRaises(ValueError):
+            args = canvaschirp.parse_command(canvaschirp.build_parser(), ["batch", "batch groups"])
+            args.handler(ctx, args)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import comment_archive as archive
+
+
+def make_event(key, comment_text, author_id=10, group_name="A01", assignment_id=7, created_at="2026-02-01T10:00:00Z"):
+    return {
+        "key": key,
+        "course_id": 1,
+        "course_name": "Algorithms",
+        "assignment_id": assignment_id,
+        "assignment_name": f"Assignment {assignment_id}",
+        "submission_user_id": author_id,
+        "author_id": author_id,
+        "author_name": f"Student {author_id}",
+        "group_name": group_name,
+        "created_at": created_at,
+        "comment_text": comment_text,
+    }
+
+
+class TestCommentArchive(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.conn = archive.connect_archive(str(Path(self.temp_dir.name) / "archive.sqlite3"))
+
+    def tearDown(self):
+        self.conn.close()
+        self.temp_dir.cleanup()
+
+    def test_add_events_is_incremental(self):
+        events = [make_event("k1", "Can I get an extension?"), make_event("k2", "Thanks")]
+        self.assertEqual(archive.add_events(self.conn, events), 2)
+        self.assertEqual(archive.add_events(self.conn, events), 0)
+
+        events[0]["comment_text"] = "Can I get an extension for the report?"
+        self.assertEqual(archive.add_events(self.conn, events), 1)
+        self.assertEqual(len(archive.search(self.conn, "report")), 1)
+        self.assertEqual(len(archive.search(self.conn, "extension")), 1)
+
+    def test_search_filters_ranks_and_highlights(self):
+        archive.add_events(
+            self.conn,
+            [
+                make_event("k1", "extension please, extension needed", author_id=10, created_at="2026-02-01T10:00:00Z"),
+                make_event("k2", "is an extension possible", author_id=11, created_at="2026-02-05T10:00:00Z"),
+                make_event("k3", "extension for assignment 8", author_id=10, assignment_id=8),
+                make_event("k4", "unrelated question", author_id=10),
+            ],
+        )
+
+        results = archive.search(self.conn, "extension")
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0]["key"], "k1")
+        self.assertIn("[extension]", results[0]["snippet"])
+
+        self.assertEqual([row["key"] for row in archive.search(self.conn, "extension", author_ids=[11])], ["k2"])
+        self.assertEqual([row["key"] for row in archive.search(self.conn, "extension", assignment_id=8)], ["k3"])
+        self.assertEqual(
+            [row["key"] for row in archive.search(self.conn, "extension", since="2026-02-02T00:00:00Z")],
+            ["k2"],
+        )
+        self.assertEqual(archive.search(self.conn, "extension", author_ids=[]), [])
+
+    def test_search_falls_back_to_literal_terms_on_syntax_error(self):
+        archive.add_events(self.conn, [make_event("k1", "what about question (3)?")])
+        self.assertEqual(len(archive.search(self.conn, "question (3")), 1)
+
+    def test_group_author_ids_and_normalize_date(self):
+        group_map = {"10": "A01", "11": "A02", "12": "a01"}
+        self.assertEqual(archive.group_author_ids(group_map, ["A01"]), [10, 12])
+        self.assertEqual(archive.normalize_date("2026-02-01"), "2026-02-01T00:00:00Z")
+        with self.assertRaises(ValueError):
+            archive.normalize_date("not a date")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,8 @@
+import json
+import tempfile
+import time
 import unittest
+from pathlib import Path
 from types import SimpleNamespace
 from unittest.mock import Mock, patch
 
@@ -6,6 +10,17 @@ import main_all as main
 
 
 class TestCourseSelection(unittest.TestCase):
+    def test_token_comes_from_the_shared_canvas_settings(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            token_file = Path(temp_dir) / "token"
+            token_file.write_text("from-file\n", encoding="utf-8")
+            with patch.dict("os.environ", {"CANVAS_TOKEN": "", "CANVAS_TOKEN_FILE": str(token_file)}):
+                self.assertEqual(main.token(), "from-file")
+            with patch.dict("os.environ", {"CANVAS_TOKEN": "from-env"}):
+                self.assertEqual(main.token(), "from-env")
+        with patch.dict("os.environ", {"CANVAS_API_BASE": "https://canvas.example"}):
+            self.assertEqual(main.notifier.get_api_base(), "https://canvas.example")
+
     def test_list_courses_includes_concluded_when_requested(self):
         canvas = Mock()
         expected_courses = [
@@ -87,16 +102,71 @@ class TestCourseSelection(unittest.TestCase):
 
         self.assertIsNone(selected)
 
+    def test_course_catalogue_is_cached_and_refreshed_in_background_when_stale(self):
+        canvas = Mock()
+        canvas.get_courses.return_value = [SimpleNamespace(id=60, name="Algorithms", course_code="2IL50")]
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache_file = str(Path(temp_dir) / "courses.json")
+            courses, refresh = main.cached_courses(canvas, fname=cache_file)
+            self.assertIsNone(refresh)
+            self.assertEqual([(c.id, c.course_code) for c in courses], [(60, "2IL50")])
+
+            courses, refresh = main.cached_courses(canvas, fname=cache_file)
+            self.assertIsNone(refresh)
+            self.assertEqual(canvas.get_courses.call_count, 1)
+
+            with open(cache_file, "r", encoding="utf-8") as f:
+                catalogue = json.load(f)
+            for entry in catalogue.values():
+                entry["fetched_at"] = time.time() - 2 * main.COURSE_CACHE_TTL_HOURS * 3600
+            with open(cache_file, "w", encoding="utf-8") as f:
+                json.dump(catalogue, f)
+            canvas.get_courses.return_value = [SimpleNamespace(id=61, name="Databases")]
+
+            courses, refresh = main.cached_courses(canvas, fname=cache_file)
+            self.assertEqual([c.id for c in courses], [60])
+            refresh.join()
+            courses, refresh = main.cached_courses(canvas, fname=cache_file)
+            self.assertEqual(([c.id for c in courses], refresh), ([61], None))
+
+    def test_find_courses_by_id_or_name_substring(self):
+        courses = [
+            SimpleNamespace(id=70, name="Algorithms", course_code="2IL50"),
+            SimpleNamespace(id=71, name="Advanced Algorithms", course_code="2IMA10"),
+        ]
+
+        self.assertEqual(main.find_courses(courses, "71"), [courses[1]])
+        self.assertEqual(main.find_courses(courses, "algorithms"), courses)
+        self.assertEqual(main.find_courses(courses, "2il"), [courses[0]])
+        self.assertEqual(main.find_courses(courses, "Databases"), [])
+
+    def test_choose_course_by_name_without_prompting(self):
+        canvas = Mock()
+        args = main.parse_args(["--course", "advanced"])
+        with patch("main_all.cached_courses", return_value=([SimpleNamespace(id=70, name="Algorithms"), SimpleNamespace(id=71, name="Advanced Algorithms")], None)):
+            with patch("builtins.input", side_effect=AssertionError("no prompt expected")):
+                course, refresh = main.choose_course(canvas, args)
+                canvas.get_course.assert_called_once_with(71)
+
+                with self.assertRaises(ValueError):
+                    main.choose_course(canvas, main.parse_args(["--course", "algo"]))
+
+        canvas.reset_mock()
+        course, refresh = main.choose_course(canvas, main.parse_args(["--course", "99"]))
+        canvas.get_course.assert_called_once_with(99)
+        canvas.get_courses.assert_not_called()
+
     @patch("main_all.get_group", return_value={})
     @patch("main_all.select_course")
-    @patch("main_all.fetch_courses")
+    @patch("main_all.cached_courses")
     @patch("main_all.token", return_value="fake-token")
     @patch("main_all.Canvas")
     def test_main_handles_missing_assignment_for_selected_course(
         self,
         mock_canvas_class,
         mock_token,
-        mock_fetch_courses,
+        mock_cached_courses,
         mock_select_course,
         mock_get_group,
     ):
@@ -110,7 +180,7 @@ class TestCourseSelection(unittest.TestCase):
         canvas = Mock()
         canvas.get_current_user.return_value = SimpleNamespace(name="Tester", id=123)
         mock_canvas_class.return_value = canvas
-        mock_fetch_courses.return_value = [course]
+        mock_cached_courses.return_value = ([course], None)
         mock_select_course.return_value = course
 
         output = []
@@ -0,0 +1,92 @@
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+import engagement
+import notify_course_comments as notifier
+
+GROUP_MAP = {"10": "A01", "11": "A02"}
+
+
+def comment(comment_id, author_id, created_at):
+    return {"id": comment_id, "author_id": author_id, "created_at": created_at}
+
+
+class TestEngagement(unittest.TestCase):
+    def test_counts_and_first_response_are_incremental(self):
+        aggregates = engagement.empty_engagement()
+        thread = [
+            comment(1, 10, "2026-02-01T10:00:00Z"),
+            comment(2, 10, "2026-02-01T11:00:00Z"),
+            comment(3, 99, "2026-02-01T12:00:00Z"),
+        ]
+
+        self.assertEqual(engagement.update_engagement(aggregates, {"7:10": thread}, GROUP_MAP), 3)
+        # The next crawl returns the whole thread again plus one new student comment.
+        thread.append(comment(4, 10, "2026-02-03T09:00:00Z"))
+        self.assertEqual(engagement.update_engagement(aggregates, {"7:10": thread}, GROUP_MAP), 1)
+
+        self.assertEqual(aggregates["comments"], {"A01": {"7": {"2026-02-01": 2, "2026-02-03": 1}}})
+        response = aggregates["responses"]["A01"]["7"]["2026-02-01"]
+        self.assertEqual((response["count"], response["total_seconds"]), (1, 7200))
+        self.assertEqual(response["buckets"], [0, 1, 0, 0, 0, 0])
+        self.assertEqual(aggregates["open"], {"7:10": {"group": "A01", "since": "2026-02-03T09:00:00Z"}})
+
+    def test_staff_comment_without_open_thread_is_not_a_response(self):
+        aggregates = engagement.empty_engagement()
+        thread = [comment(1, 99, "2026-02-01T10:00:00Z"), comment(2, 11, "2026-02-01T10:30:00Z")]
+
+        engagement.update_engagement(aggregates, {"8:11": thread}, GROUP_MAP)
+
+        self.assertEqual(aggregates["responses"], {})
+        self.assertEqual(aggregates["comments"], {"A02": {"8": {"2026-02-01": 1}}})
+
+    def test_report_filters_and_rolls_up(self):
+        aggregates = engagement.empty_engagement()
+        engagement.update_engagement(
+            aggregates,
+            {
+                "7:10": [comment(1, 10, "2026-02-01T10:00:00Z"), comment(2, 99, "2026-02-01T10:30:00Z")],
+                "8:10": [comment(3, 10, "2026-02-05T10:00:00Z"), comment(4, 99, "2026-02-07T10:00:00Z")],
+                "7:11": [comment(5, 11, "2026-02-02T10:00:00Z")],
+            },
+            GROUP_MAP,
+        )
+
+        rows = {row["key"]: row for row in engagement.build_report(aggregates)}
+        self.assertEqual((rows["A01"]["comments"], rows["A01"]["responses"]), (2, 2))
+        self.assertEqual(rows["A01"]["max_seconds"], 2 * 24 * 3600)
+        self.assertEqual(rows["A01"]["median_bucket"], "<1h")
+        self.assertEqual((rows["A02"]["unanswered"], rows["A02"]["mean_seconds"]), (1, None))
+
+        rows = engagement.build_report(aggregates, by="assignment", group="a01", since="2026-02-03")
+        self.assertEqual([(row["key"], row["comments"]) for row in rows], [("8", 1)])
+
+    def test_file_round_trip_and_collection_from_crawl(self):
+        submission = SimpleNamespace(
+            user_id=10,
+            submission_comments=[
+                {"id": 1, "author_id": 10, "author_name": "Student A", "created_at": "2026-02-01T10:00:00Z", "comment": "Hi"},
+                {"id": 2, "author_id": 99, "author_name": "TA", "created_at": "2026-02-01T10:10:00Z", "comment": "Hello"},
+            ],
+        )
+        assignment = SimpleNamespace(id=7, name="Report", html_url=None, published=True, has_submitted_submissions=True)
+        assignment.get_submissions = lambda **kwargs: [submission]
+        course = SimpleNamespace(id=1, name="Algorithms")
+
+        thread_comments = {}
+        notifier.collect_candidate_events(course, GROUP_MAP, assignments=[assignment], thread_comments=thread_comments)
+        self.assertEqual([item["id"] for item in thread_comments["7:10"]], [1, 2])
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            engagement_file = str(Path(temp_dir) / "engagement.json")
+            self.assertEqual(engagement.update_engagement_file(engagement_file, thread_comments, GROUP_MAP), 2)
+            self.assertEqual(engagement.update_engagement_file(engagement_file, thread_comments, GROUP_MAP), 0)
+            stored = engagement.load_engagement(engagement_file)
+        self.assertEqual(stored["watermarks"], {"7:10": ["2026-02-01T10:10:00Z", 2]})
+        self.assertEqual(stored["responses"]["A01"]["7"]["2026-02-01"]["count"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+from datetime import datetime, timezone
+
+import freshness
+import notify_course_comments as notifier
+
+
+def seen_entry(created_at, delivered_at=None):
+    entry = {"created_at": created_at, "assignment_id": 7, "author_id": 10, "saved_at": delivered_at or created_at}
+    if delivered_at:
+        entry["delivered_at"] = delivered_at
+    return entry
+
+
+class TestFreshness(unittest.TestCase):
+    def test_percentile_and_histogram(self):
+        values = [float(value) for value in range(1, 101)]
+        self.assertEqual(freshness.percentile(values, 50), 50)
+        self.assertEqual(freshness.percentile(values, 95), 95)
+        self.assertIsNone(freshness.percentile([], 95))
+
+        histogram = freshness.lag_histogram([10, 59, 60, 4000, 10 * 24 * 3600])
+        self.assertEqual(histogram, [2, 1, 0, 0, 1, 0, 0, 1])
+        self.assertEqual(len(freshness.bucket_labels()), len(histogram))
+
+    def test_run_summary_counts_only_delivered_entries_and_flags_slo(self):
+        seen = {
+            "fast": seen_entry("2026-02-01T10:00:00Z", "2026-02-01T10:05:00Z"),
+            "slow": seen_entry("2026-02-01T10:00:00Z", "2026-02-02T10:00:00Z"),
+            "baseline": seen_entry("2026-01-01T10:00:00Z"),
+        }
+
+        run = freshness.run_summary(seen, ["fast", "slow", "baseline"], "2026-02-02T10:00:00Z", slo_seconds=3600)
+
+        self.assertEqual(run["delivered"], 2)
+        self.assertEqual(run["p50"], 300)
+        self.assertEqual(run["max"], 24 * 3600)
+        self.assertTrue(run["slo"]["violated"])
+        self.assertFalse(freshness.run_summary(seen, ["fast"], "x", slo_seconds=3600)["slo"]["violated"])
+        self.assertNotIn("slo", freshness.run_summary(seen, ["fast"], "x"))
+
+    def test_report_uses_window_for_rolling_lags_and_runs(self):
+        state = {
+            "seen": {
+                "old": seen_entry("2026-01-01T10:00:00Z", "2026-01-01T12:00:00Z"),
+                "new": seen_entry("2026-02-10T10:00:00Z", "2026-02-10T10:01:00Z"),
+            },
+            "freshness": [
+                {"run_at": "2026-01-01T12:00:00Z", "delivered": 1, "slo": {"violated": True}},
+                {"run_at": "2026-02-10T10:01:00Z", "delivered": 1, "slo": {"violated": False}},
+            ],
+        }
+
+        report = freshness.build_report(state, datetime(2026, 2, 1, tzinfo=timezone.utc), slo_seconds=300)
+
+        self.assertEqual(report["rolling"]["delivered"], 1)
+        self.assertEqual(report["rolling"]["max"], 60)
+        self.assertFalse(report["rolling"]["slo"]["violated"])
+        self.assertEqual(len(report["runs"]), 1)
+        self.assertEqual(report["violations"], 0)
+
+    def test_shard_fragments_carry_freshness_runs_and_history_is_capped(self):
+        state = {"version": 1, "seen": {}, "freshness": [{"run_at": "2026-02-01T00:00:00Z"}]}
+        fragment = notifier.build_state_fragment((1, 2), {}, [], {}, freshness_run={"run_at": "2026-02-02T00:00:00Z"})
+        notifier.merge_state_fragments(state, [fragment])
+        self.assertEqual([run["run_at"] for run in state["freshness"]], ["2026-02-01T00:00:00Z", "2026-02-02T00:00:00Z"])
+
+        notifier.record_freshness_run(state, {"run_at": "2026-02-03T00:00:00Z"}, limit=2)
+        self.assertEqual([run["run_at"] for run in state["freshness"]], ["2026-02-02T00:00:00Z", "2026-02-03T00:00:00Z"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,12 @@
+import json
+import os
 import tempfile
+import threading
 import unittest
+from datetime import datetime, timezone
 from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
 
 import notify_course_comments as notifier
 
@@ -46,6 +52,31 @@ class TestNotifyCourseComments(unittest.TestCase):
         key_two = notifier.make_comment_key(1, 2, 3, comment_two)
         self.assertEqual(key_one, key_two)
 
+    def test_make_comment_key_fast_path_matches_canonical_json(self):
+        import hashlib
+
+        for course_id, assignment_id, submission_user_id, comment_id in (
+            (1, 2, 3, 4),
+            (1, None, 3, 4),
+            (1, 2, None, 10**12),
+            (None, 2, 3, 4),
+            (1, 2, 3, "4"),
+        ):
+            canonical = json.dumps(
+                {
+                    "course_id": course_id,
+                    "assignment_id": assignment_id,
+                    "submission_user_id": submission_user_id,
+                    "comment_id": comment_id,
+                },
+                sort_keys=True,
+                separators=(",", ":"),
+            )
+            self.assertEqual(
+                notifier.make_comment_key(course_id, assignment_id, submission_user_id, {"id": comment_id}),
+                hashlib.sha256(canonical.encode("utf-8")).hexdigest(),
+            )
+
     def test_make_comment_key_normalizes_fallback_text(self):
         comment_one = {
             "author_id": 120,
@@ -109,6 +140,19 @@ class TestNotifyCourseComments(unittest.TestCase):
         self.assertEqual(payload.get("@type"), "MessageCard")
         self.assertIn("text", payload)
 
+    def test_edits_and_deletions_are_labelled_in_cards_and_digests(self):
+        edited = {"change": "edited", "created_at": "2026-02-01T10:00:00Z", "comment_text": "fixed typo"}
+        deleted = {"change": "deleted", "created_at": "2026-02-01T11:00:00Z", "comment_text": ""}
+
+        payload = notifier.build_teams_payload(
+            "https://example.invalid/workflows/abc", "text", "adaptivecard", notifier.comment_title(edited)
+        )
+        self.assertEqual(payload["body"][0]["text"], "Edited Canvas student comment")
+        self.assertTrue(notifier.build_digest_line(edited).startswith("- [edited] "))
+        line = notifier.build_digest_line(deleted)
+        self.assertTrue(line.startswith("- [deleted] "))
+        self.assertTrue(line.endswith("(deleted in Canvas)"))
+
     def test_state_round_trip(self):
         with tempfile.TemporaryDirectory() as temp_dir:
             state_path = Path(temp_dir) / "state.json"
@@ -142,6 +186,527 @@ class TestNotifyCourseComments(unittest.TestCase):
             self.assertFalse(exists)
             self.assertEqual(loaded_state.get("seen"), {})
 
+    def test_load_state_keeps_assignment_records(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            state_path = Path(temp_dir) / "state.json"
+            notifier.save_state(
+                str(state_path),
+                {
+                    "version": 1,
+                    "seen": {},
+                    "assignments": {"7": {"last_activity": None, "updated_at": "x"}},
+                    "last_full_sweep": "2026-02-01T00:00:00Z",
+                },
+            )
+            loaded_state, _ = notifier.load_state(str(state_path))
+            self.assertIn("7", loaded_state.get("assignments", {}))
+            self.assertEqual(loaded_state.get("last_full_sweep"), "2026-02-01T00:00:00Z")
+
+    def test_prune_assignments_skips_unpublished_and_closed_inactive(self):
+        now = datetime(2026, 3, 1, tzinfo=timezone.utc)
+        unpublished = SimpleNamespace(id=1, published=False)
+        never_submitted = SimpleNamespace(
+            id=2, published=True, has_submitted_submissions=False, due_at="2026-01-15T00:00:00Z"
+        )
+        closed = SimpleNamespace(
+            id=3,
+            published=True,
+            has_submitted_submissions=True,
+            needs_grading_count=0,
+            updated_at="2026-01-01T00:00:00Z",
+            lock_at="2026-01-15T00:00:00Z",
+        )
+        open_assignment = SimpleNamespace(
+            id=4,
+            published=True,
+            has_submitted_submissions=True,
+            needs_grading_count=0,
+            updated_at="2026-01-01T00:00:00Z",
+            lock_at="2026-04-01T00:00:00Z",
+        )
+        records = {
+            "3": {"last_activity": "2026-01-10T00:00:00Z", "updated_at": "2026-01-01T00:00:00Z"},
+            "4": {"last_activity": "2026-01-10T00:00:00Z", "updated_at": "2026-01-01T00:00:00Z"},
+        }
+
+        selected, pruned = notifier.prune_assignments(
+            [unpublished, never_submitted, closed, open_assignment], records, now
+        )
+
+        self.assertEqual([item.id for item in selected], [4])
+        self.assertEqual(pruned, {"unpublished": 1, "no_submissions": 1, "closed_inactive": 1})
+
+    def test_prune_assignments_crawls_open_assignment_without_submissions(self):
+        now = datetime(2026, 3, 1, tzinfo=timezone.utc)
+        no_deadline = SimpleNamespace(id=1, published=True, has_submitted_submissions=False)
+        open_assignment = SimpleNamespace(
+            id=2, published=True, has_submitted_submissions=False, due_at="2026-03-10T00:00:00Z"
+        )
+        just_closed = SimpleNamespace(
+            id=3, published=True, has_submitted_submissions=False, lock_at="2026-02-25T00:00:00Z"
+        )
+
+        selected, pruned = notifier.prune_assignments([no_deadline, open_assignment, just_closed], {}, now)
+
+        self.assertEqual([item.id for item in selected], [1, 2, 3])
+        self.assertEqual(pruned, {})
+
+    def test_prune_assignments_crawls_closed_assignment_with_recent_activity_or_changes(self):
+        now = datetime(2026, 3, 1, tzinfo=timezone.utc)
+        closed = SimpleNamespace(
+            id=3,
+            published=True,
+            has_submitted_submissions=True,
+            needs_grading_count=0,
+            updated_at="2026-02-20T00:00:00Z",
+            lock_at="2026-01-15T00:00:00Z",
+        )
+        changed = {"3": {"last_activity": "2026-01-10T00:00:00Z", "updated_at": "2026-01-01T00:00:00Z"}}
+        recent = {"3": {"last_activity": "2026-02-25T00:00:00Z", "updated_at": "2026-02-20T00:00:00Z"}}
+
+        self.assertEqual(len(notifier.prune_assignments([closed], changed, now)[0]), 1)
+        self.assertEqual(len(notifier.prune_assignments([closed], recent, now)[0]), 1)
+
+    def test_full_sweep_ignores_pruning_rules(self):
+        now = datetime(2026, 3, 1, tzinfo=timezone.utc)
+        unpublished = SimpleNamespace(id=1, published=False)
+
+        selected, pruned = notifier.prune_assignments([unpublished], {}, now, full_sweep=True)
+
+        self.assertEqual(selected, [unpublished])
+        self.assertEqual(pruned, {})
+
+    def test_is_full_sweep_due(self):
+        now = datetime(2026, 3, 1, tzinfo=timezone.utc)
+        self.assertTrue(notifier.is_full_sweep_due({}, now, 168))
+        self.assertFalse(
+            notifier.is_full_sweep_due({"last_full_sweep": "2026-02-28T00:00:00Z"}, now, 168)
+        )
+        self.assertTrue(
+            notifier.is_full_sweep_due({"last_full_sweep": "2026-02-20T00:00:00Z"}, now, 168)
+        )
+
+    def test_collect_candidate_events_records_assignment_activity(self):
+        submission = SimpleNamespace(
+            user_id=5,
+            submission_comments=[
+                {"id": 1, "author_id": 10, "created_at": "2026-02-01T10:00:00Z", "comment": "hi"},
+                {"id": 2, "author_id": 99, "created_at": "2026-02-03T10:00:00Z", "comment": "ta"},
+            ],
+        )
+        assignment = SimpleNamespace(
+            id=7,
+            name="Report",
+            updated_at="2026-01-01T00:00:00Z",
+            get_submissions=lambda **kwargs: [submission],
+        )
+        course = SimpleNamespace(id=1, name="Course")
+        activity = {}
+
+        events = notifier.collect_candidate_events(
+            course, {"10": "A01"}, assignments=[assignment], activity=activity
+        )
+
+        self.assertEqual(len(events), 1)
+        self.assertEqual(
+            activity["7"],
+            {"last_activity": "2026-02-03T10:00:00Z", "updated_at": "2026-01-01T00:00:00Z"},
+        )
+
+    def make_thread_assignment(self, comments_by_user):
+        submissions = [
+            SimpleNamespace(user_id=user_id, submission_comments=comments)
+            for user_id, comments in comments_by_user.items()
+        ]
+        return SimpleNamespace(id=7, name="Report", get_submissions=lambda **kwargs: submissions)
+
+    def test_comment_edits_and_deletions_are_detected_for_refetched_assignments(self):
+        course = SimpleNamespace(id=1, name="Course")
+        group_map = {"10": "A01", "11": "A02"}
+        original = {
+            5: [
+                {"id": 1, "author_id": 10, "created_at": "2026-02-01T10:00:00Z", "comment": "first draft"},
+                {"id": 2, "author_id": 10, "created_at": "2026-02-01T11:00:00Z", "comment": "keep  me"},
+                {"id": 3, "author_id": 99, "created_at": "2026-02-01T12:00:00Z", "comment": "TA"},
+            ],
+            6: [{"id": 4, "author_id": 11, "created_at": "2026-02-01T10:00:00Z", "comment": "bye"}],
+        }
+        stored = {}
+        notifier.collect_candidate_events(course, group_map, assignments=[self.make_thread_assignment(original)], threads=stored)
+        self.assertEqual(set(stored["7"]["5"]), {"1", "2"})
+
+        seen = {}
+        deleted_key = notifier.make_comment_key(1, 7, 6, {"id": 4})
+        seen[deleted_key] = {"created_at": "2026-02-01T10:00:00Z", "assignment_id": 7, "author_id": 11}
+        recrawl = {
+            5: [
+                {"id": 1, "author_id": 10, "created_at": "2026-02-01T10:00:00Z", "comment": "final text"},
+                {"id": 2, "author_id": 10, "created_at": "2026-02-01T11:00:00Z", "comment": "keep me"},
+                {"id": 3, "author_id": 99, "created_at": "2026-02-01T12:00:00Z", "comment": "TA edited"},
+            ],
+            6: [],
+        }
+        assignment = self.make_thread_assignment(recrawl)
+        fetched, comment_ids = {}, {}
+        candidates = notifier.collect_candidate_events(
+            course, group_map, assignments=[assignment], threads=fetched, comment_ids=comment_ids
+        )
+
+        changes = notifier.diff_comment_threads(stored, fetched, comment_ids)
+        self.assertEqual(sorted(change[0] for change in changes), ["deleted", "edited"])
+        events = {event["change"]: event for event in notifier.build_change_events(changes, candidates, seen, course, [assignment], group_map)}
+        self.assertEqual(events["edited"]["comment_text"], "final text")
+        self.assertEqual(events["deleted"]["author_id"], 11)
+        self.assertEqual(events["deleted"]["group_name"], "A02")
+        self.assertIn("Deleted Canvas student comment", notifier.build_teams_text(events["deleted"]))
+        self.assertNotEqual(events["edited"]["key"], notifier.make_comment_key(1, 7, 5, {"id": 1}))
+
+        self.assertTrue(notifier.update_comment_threads(stored, fetched))
+        self.assertEqual(notifier.diff_comment_threads(stored, fetched, comment_ids), [])
+        self.assertFalse(notifier.update_comment_threads(stored, fetched))
+        # Assignments that weren't re-fetched are never compared.
+        self.assertEqual(notifier.diff_comment_threads(stored, {}, {}), [])
+
+    def test_student_removed_from_group_map_is_not_reported_as_deleted(self):
+        course = SimpleNamespace(id=1, name="Course")
+        comments = {
+            5: [{"id": 1, "author_id": 10, "created_at": "2026-02-01T10:00:00Z", "comment": "hi"}],
+            6: [{"id": 2, "author_id": 11, "created_at": "2026-02-01T10:00:00Z", "comment": "hello"}],
+        }
+        stored = {}
+        notifier.collect_candidate_events(
+            course, {"10": "A01", "11": "A02"}, assignments=[self.make_thread_assignment(comments)], threads=stored
+        )
+
+        # student_groups.json was regenerated without student 11.
+        fetched, comment_ids = {}, {}
+        notifier.collect_candidate_events(
+            course,
+            {"10": "A01"},
+            assignments=[self.make_thread_assignment(comments)],
+            threads=fetched,
+            comment_ids=comment_ids,
+        )
+
+        self.assertEqual(notifier.diff_comment_threads(stored, fetched, comment_ids), [])
+        comments[6] = []
+        fetched, comment_ids = {}, {}
+        notifier.collect_candidate_events(
+            course,
+            {"10": "A01"},
+            assignments=[self.make_thread_assignment(comments)],
+            threads=fetched,
+            comment_ids=comment_ids,
+        )
+        self.assertEqual(
+            notifier.diff_comment_threads(stored, fetched, comment_ids), [("deleted", "7", "6", "2", None)]
+        )
+
+    def test_parse_shard(self):
+        self.assertEqual(notifier.parse_shard("2/4"), (2, 4))
+        for value in ("0/4", "5/4", "2", "a/b", "1/0"):
+            with self.assertRaises(ValueError):
+                notifier.parse_shard(value)
+
+    def test_assignment_shard_is_stable_and_covers_all_shards(self):
+        self.assertEqual(notifier.assignment_shard(146386, 4), notifier.assignment_shard("146386", 4))
+        shards = {notifier.assignment_shard(assignment_id, 4) for assignment_id in range(100)}
+        self.assertEqual(shards, {1, 2, 3, 4})
+        self.assertEqual({notifier.assignment_shard(assignment_id, 1) for assignment_id in range(10)}, {1})
+
+    def test_shard_fragments_merge_into_state(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            state_path = Path(temp_dir) / "state.json"
+            notifier.save_state(
+                str(state_path),
+                {"version": 1, "seen": {"old": {"assignment_id": 1}}, "last_full_sweep": "2026-01-01T00:00:00Z"},
+            )
+            fragment_paths = []
+            for shard, key, assignment_id in (((1, 2), "k1", "7"), ((2, 2), "k2", "8")):
+                seen = {key: {"assignment_id": int(assignment_id)}}
+                fragment = notifier.build_state_fragment(
+                    shard,
+                    seen,
+                    [key],
+                    {assignment_id: {"last_activity": None, "updated_at": None}},
+                    "2026-02-01T00:00:00Z",
+                )
+                fragment_path = notifier.shard_fragment_path(str(state_path), shard)
+                notifier.save_state(fragment_path, fragment)
+                fragment_paths.append(fragment_path)
+
+            self.assertTrue(fragment_paths[0].endswith("shards/state.shard-1-of-2.json"))
+            notifier.merge_shard_files(str(state_path), fragment_paths)
+
+            merged, _ = notifier.load_state(str(state_path))
+            self.assertEqual(set(merged["seen"]), {"old", "k1", "k2"})
+            self.assertEqual(set(merged["assignments"]), {"7", "8"})
+            self.assertEqual(merged["last_full_sweep"], "2026-02-01T00:00:00Z")
+
+    def test_expand_group_pattern(self):
+        self.assertEqual(notifier.expand_group_pattern("A01-A03"), ["A01", "A02", "A03"])
+        self.assertEqual(notifier.expand_group_pattern("A08-10"), ["A08", "A09", "A10"])
+        self.assertEqual(notifier.expand_group_pattern("No Group"), ["No Group"])
+
+    def test_load_routes_and_resolve_precedence(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            routing_path = Path(temp_dir) / "routes.json"
+            routing_path.write_text(
+                json.dumps(
+                    {
+                        "groups": {"A01-A10": "env:TEST_TA1_WEBHOOK", "A11": "https://hooks.example/ta2"},
+                        "assignments": {"7": "https://hooks.example/report"},
+                    }
+                ),
+                encoding="utf-8",
+            )
+            with patch.dict(os.environ, {"TEST_TA1_WEBHOOK": "https://hooks.example/ta1"}):
+                routes = notifier.load_routes(str(routing_path), "https://hooks.example/default")
+
+        self.assertEqual(notifier.resolve_route({"assignment_id": 7, "group_name": "A02"}, routes), "https://hooks.example/report")
+        self.assertEqual(notifier.resolve_route({"assignment_id": 8, "group_name": "A10"}, routes), "https://hooks.example/ta1")
+        self.assertEqual(notifier.resolve_route({"assignment_id": 8, "group_name": "A11"}, routes), "https://hooks.example/ta2")
+        self.assertEqual(notifier.resolve_route({"assignment_id": 8, "group_name": "A12"}, routes), "https://hooks.example/default")
+        self.assertEqual(routes["labels"]["https://hooks.example/ta1"], "groups A01-A10")
+
+    def test_load_routes_requires_a_default(self):
+        with self.assertRaises(ValueError):
+            notifier.load_routes(None, "")
+
+    def test_delivery_pool_keeps_destinations_independent(self):
+        slow_started = threading.Event()
+        release_slow = threading.Event()
+        delivered = []
+
+        def send(destination, event):
+            if destination == "slow":
+                slow_started.set()
+                release_slow.wait(timeout=5)
+            delivered.append((destination, event["key"]))
+            return event["key"] != "fast-2"
+
+        pool = notifier.DeliveryPool(send, lambda event: event["route"])
+        pool.submit({"key": "slow-1", "route": "slow"})
+        slow_started.wait(timeout=5)
+        for key in ("fast-1", "fast-2"):
+            pool.submit({"key": key, "route": "fast"})
+
+        results = pool.results()
+        first = [next(results), next(results)]
+        release_slow.set()
+        rest = list(results)
+
+        self.assertEqual([event["key"] for _, event, _ in first], ["fast-1", "fast-2"])
+        self.assertEqual([success for _, _, success in first], [True, False])
+        self.assertEqual([event["key"] for _, event, _ in rest], ["slow-1"])
+
+    def make_routes(self):
+        return {"default": "https://hooks.example/default", "groups": {}, "assignments": {}, "labels": {"https://hooks.example/default": "default"}}
+
+    def test_failed_delivery_goes_to_dead_letters_without_webhook_url(self):
+        seen, dead_letters, new_keys = {}, {}, []
+        events = [
+            {"key": "k1", "assignment_id": 7, "author_id": 10, "created_at": "2026-02-01T10:00:00Z", "comment_text": "hi", "comment": {"id": 1}},
+            {"key": "k2", "assignment_id": 7, "author_id": 11, "created_at": "2026-02-01T11:00:00Z", "comment_text": "yo", "comment": {"id": 2}},
+        ]
+
+        sent, per_destination = notifier.deliver_events(
+            events, self.make_routes(), lambda destination, event: event["key"] == "k1", seen, dead_letters, new_keys
+        )
+
+        self.assertEqual(sent, 1)
+        self.assertEqual(per_destination, {"default": [1, 1, 0]})
+        self.assertEqual(set(seen), {"k1"})
+        self.assertEqual(seen["k1"]["delivered_at"], seen["k1"]["saved_at"])
+        self.assertEqual(new_keys, ["k1"])
+        self.assertEqual(dead_letters["k2"]["attempts"], 1)
+        self.assertEqual(dead_letters["k2"]["event"]["comment_text"], "yo")
+        self.assertNotIn("comment", dead_letters["k2"]["event"])
+        self.assertNotIn("hooks.example", json.dumps(dead_letters))
+
+    def test_score_event_ranks_keywords_due_dates_groups_and_recency(self):
+        now = datetime(2026, 2, 10, 12, 0, tzinfo=timezone.utc)
+        rules = notifier.load_priority_rules()
+        rules["groups"] = {"A01"}
+        base = {"created_at": "2026-02-09T12:00:00Z", "group_name": "B01", "comment_text": "thanks"}
+
+        plain = notifier.score_event(base, rules, now)
+        self.assertAlmostEqual(plain, 5.0)
+        self.assertGreater(notifier.score_event({**base, "created_at": "2026-02-10T11:00:00Z"}, rules, now), plain)
+        self.assertGreater(notifier.score_event({**base, "assignment_due_at": "2026-02-11T12:00:00Z"}, rules, now), plain)
+        self.assertEqual(notifier.score_event({**base, "assignment_due_at": "2026-03-01T12:00:00Z"}, rules, now), plain)
+        self.assertEqual(notifier.score_event({**base, "group_name": "A01"}, rules, now), plain + 15)
+        self.assertEqual(notifier.score_event({**base, "comment_text": "URGENT: wrong file"}, rules, now), plain + 30)
+
+    def test_load_priority_rules_merges_file_and_expands_groups(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            rules_file = Path(temp_dir) / "priority.json"
+            rules_file.write_text(json.dumps({"groups": ["A01-A03"], "keywords": ["Help"]}), encoding="utf-8")
+            rules = notifier.load_priority_rules(str(rules_file))
+            self.assertEqual(rules["groups"], {"A01", "A02", "A03"})
+            self.assertEqual(rules["keywords"], ["help"])
+            self.assertEqual(rules["keyword_weight"], notifier.DEFAULT_PRIORITY_RULES["keyword_weight"])
+
+            rules_file.write_text(json.dumps({"keyword_wieght": 5}), encoding="utf-8")
+            with self.assertRaises(ValueError):
+                notifier.load_priority_rules(str(rules_file))
+
+    def test_delivery_pool_sends_highest_priority_first(self):
+        order = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def send(destination, event):
+            started.set()
+            release.wait(timeout=5)
+            order.append(event["key"])
+            return True
+
+        pool = notifier.DeliveryPool(send, lambda event: "default", priority=lambda event: event["score"])
+        pool.submit({"key": "first", "score": 0})
+        started.wait(timeout=5)
+        # The worker is busy with the first event; the rest queue up behind it.
+        for key, score in (("low", 1), ("high", 9), ("mid", 5)):
+            pool.submit({"key": key, "score": score})
+        release.set()
+        list(pool.results())
+
+        self.assertEqual(order[1:], ["high", "mid", "low"])
+
+    def test_deliver_events_digests_remaining_events_after_deadline(self):
+        seen, dead_letters, new_keys = {}, {}, []
+        events = [
+            {"key": f"k{index}", "assignment_id": 7, "author_id": 10, "created_at": "2026-02-01T10:00:00Z", "comment_text": "hi", "comment": {"id": index}}
+            for index in range(3)
+        ]
+        digests = []
+
+        sent, per_destination = notifier.deliver_events(
+            events,
+            self.make_routes(),
+            lambda destination, event: self.fail("budget already spent"),
+            seen,
+            dead_letters,
+            new_keys,
+            deadline=0.0,
+            send_digest=lambda destination, batch: digests.append([event["key"] for event in batch]) or True,
+        )
+
+        self.assertEqual(sent, 3)
+        self.assertEqual(per_destination, {"default": [3, 0, 3]})
+        self.assertEqual(digests, [["k0", "k1", "k2"]])
+        self.assertEqual(sorted(new_keys), ["k0", "k1", "k2"])
+        self.assertEqual(dead_letters, {})
+        self.assertIn("3 comments", notifier.build_digest_text(events))
+
+    def test_digests_are_split_to_fit_the_webhook_limit_and_fail_per_batch(self):
+        seen, dead_letters, new_keys = {}, {}, []
+        events = [
+            {"key": f"k{index}", "assignment_id": 7, "author_id": 10, "created_at": "2026-02-01T10:00:00Z", "comment_text": "é" * 300, "comment": {"id": index}}
+            for index in range(200)
+        ]
+        batches = notifier.split_digest(events)
+        self.assertGreater(len(batches), 1)
+        self.assertEqual(sum(len(batch) for batch in batches), 200)
+        for batch in batches:
+            self.assertLessEqual(len(batch), notifier.DEFAULT_DIGEST_MAX_EVENTS)
+            self.assertLess(len(json.dumps({"text": notifier.build_digest_text(batch)})), 28000)
+
+        posted = []
+
+        def send_digest(destination, batch):
+            posted.append(len(batch))
+            return len(posted) != 2
+
+        sent, per_destination = notifier.deliver_events(
+            events,
+            self.make_routes(),
+            lambda destination, event: self.fail("budget already spent"),
+            seen,
+            dead_letters,
+            new_keys,
+            deadline=0.0,
+            send_digest=send_digest,
+        )
+
+        self.assertEqual(posted, [len(batch) for batch in batches])
+        self.assertEqual(len(dead_letters), posted[1])
+        self.assertEqual(sent, 200 - posted[1])
+        self.assertEqual(per_destination["default"], [sent, posted[1], sent])
+
+    def test_retry_dead_letter_files_keeps_what_a_concurrent_run_saved(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            state_file = str(Path(temp_dir) / "state.json")
+            dead_letter_file = str(Path(temp_dir) / "dead_letters.json")
+            recent = notifier.utc_now_iso()
+            notifier.save_state(state_file, {"version": 1, "seen": {}})
+            notifier.save_dead_letters(
+                dead_letter_file,
+                {
+                    key: {"event": {"key": key, "assignment_id": 7}, "attempts": 1, "first_failed_at": recent}
+                    for key in ("ok", "flaky")
+                },
+            )
+
+            def send(destination, event):
+                # A scheduled run saves its own progress while this pass is posting.
+                state, _ = notifier.load_state(state_file)
+                state["seen"]["from-run"] = {"saved_at": recent}
+                notifier.save_state(state_file, state)
+                dead_letters = notifier.load_dead_letters(dead_letter_file)
+                dead_letters["run-failure"] = {"event": {"key": "run-failure"}, "attempts": 1, "first_failed_at": recent}
+                notifier.save_dead_letters(dead_letter_file, dead_letters)
+                return event["key"] == "ok"
+
+            result = notifier.retry_dead_letter_files(state_file, dead_letter_file, self.make_routes(), send)
+
+            self.assertEqual(result, (1, 1, 0))
+            state, _ = notifier.load_state(state_file)
+            self.assertEqual(set(state["seen"]), {"from-run", "ok"})
+            dead_letters = notifier.load_dead_letters(dead_letter_file)
+            self.assertEqual(set(dead_letters), {"flaky", "run-failure"})
+            self.assertEqual(dead_letters["flaky"]["attempts"], 2)
+
+    def test_retry_dead_letters_resends_and_expires_without_canvas(self):
+        recent = notifier.utc_now_iso()
+        dead_letters = {
+            "ok": {"event": {"key": "ok", "assignment_id": 7}, "attempts": 1, "first_failed_at": recent},
+            "flaky": {"event": {"key": "flaky", "assignment_id": 7}, "attempts": 1, "first_failed_at": recent},
+            "old": {"event": {"key": "old", "assignment_id": 7}, "attempts": 1, "first_failed_at": "2020-01-01T00:00:00Z"},
+            "tired": {"event": {"key": "tired", "assignment_id": 7}, "attempts": 10, "first_failed_at": recent},
+        }
+        seen, new_keys = {}, []
+
+        sent, failed, expired = notifier.retry_dead_letters(
+            dead_letters, self.make_routes(), lambda destination, event: event["key"] == "ok", seen, new_keys,
+            max_attempts=10, max_age_hours=72,
+        )
+
+        self.assertEqual((sent, failed, expired), (1, 1, 2))
+        self.assertEqual(set(dead_letters), {"flaky"})
+        self.assertEqual(dead_letters["flaky"]["attempts"], 2)
+        self.assertEqual(set(seen), {"ok", "old", "tired"})
+        self.assertIn("dropped_at", seen["old"])
+        self.assertNotIn("dropped_at", seen["ok"])
+
+    def test_dead_letters_round_trip_and_merge_per_shard(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            dead_letter_path = str(Path(temp_dir) / "dead_letters.json")
+            self.assertEqual(notifier.load_dead_letters(dead_letter_path), {})
+
+            assignment_in_shard_one = next(i for i in range(100) if notifier.assignment_shard(i, 2) == 1)
+            assignment_in_shard_two = next(i for i in range(100) if notifier.assignment_shard(i, 2) == 2)
+            dead_letters = {
+                "a": {"event": {"key": "a", "assignment_id": assignment_in_shard_one}, "attempts": 1},
+                "b": {"event": {"key": "b", "assignment_id": assignment_in_shard_two}, "attempts": 1},
+            }
+            notifier.save_dead_letters(dead_letter_path, dead_letters)
+            self.assertEqual(notifier.load_dead_letters(dead_letter_path), dead_letters)
+
+            self.assertEqual(set(notifier.dead_letters_for_shard(dead_letters, (1, 2))), {"a"})
+            notifier.merge_dead_letter_fragments(dead_letters, [{"shard": "1/2", "dead_letters": {}}])
+            self.assertEqual(set(dead_letters), {"b"})
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,143 @@
+import json
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+import canvas_mirror as mirror
+import notify_course_comments as notifier
+import push_receiver
+
+SECRET = "test-secret"
+
+
+def make_routes():
+    return {"default": "https://hooks.example/default", "groups": {}, "assignments": {}, "labels": {"https://hooks.example/default": "default"}}
+
+
+class TestPushReceiver(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.state_file = str(Path(self.temp_dir.name) / "state.json")
+        self.dead_letter_file = str(Path(self.temp_dir.name) / "dead_letters.json")
+        self.sent = []
+        self.receiver = self.make_receiver()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def make_receiver(self, **kwargs):
+        def send(destination, event):
+            self.sent.append(event["key"])
+            return True
+
+        return push_receiver.PushReceiver(
+            1, {"10": "A01"}, make_routes(), send, self.state_file, self.dead_letter_file, SECRET, batch_window=0, **kwargs
+        )
+
+    def receive(self, payload, secret=SECRET):
+        body = json.dumps(payload).encode("utf-8")
+        return self.receiver.receive(body, push_receiver.sign_payload(secret, body))
+
+    def test_parse_notification_converts_global_ids(self):
+        payload = push_receiver.build_live_event(10000000000001, 10000000000500, 10000000000042, 10000000000010, "Hi")
+        notification = push_receiver.parse_notification(payload)
+        self.assertEqual(notification["course_id"], 1)
+        self.assertEqual(notification["submission_id"], 500)
+        self.assertEqual(notification["comment_id"], 42)
+        self.assertEqual(notification["author_id"], 10)
+        with self.assertRaises(ValueError):
+            push_receiver.parse_notification({"metadata": {"event_name": "submission_created"}})
+
+    def test_rejects_bad_signature_and_ignores_other_authors(self):
+        payload = push_receiver.build_live_event(1, 500, 42, 10, "Hi", assignment_id=7, submission_user_id=10)
+        status, _ = self.receive(payload, secret="wrong")
+        self.assertEqual(status, 401)
+
+        status, outcome = self.receive(push_receiver.build_live_event(1, 500, 43, 77, "TA reply", assignment_id=7, submission_user_id=10))
+        self.assertEqual((status, outcome["ignored"]), (202, 1))
+        status, outcome = self.receive(push_receiver.build_live_event(2, 500, 44, 10, "Other course", assignment_id=7, submission_user_id=10))
+        self.assertEqual(outcome["ignored"], 1)
+
+    def test_pushed_comment_is_delivered_once_and_persisted(self):
+        payload = push_receiver.build_live_event(1, 500, 42, 10, "Hi", created_at="2026-02-01T10:00:00Z", assignment_id=7, submission_user_id=10)
+
+        self.assertEqual(self.receive(payload), (202, {"queued": 1, "duplicate": 0, "ignored": 0, "unresolved": 0}))
+        self.assertEqual(self.receive(payload)[1]["duplicate"], 1)
+        self.assertEqual(self.receiver.deliver_pending(timeout=1), 1)
+        self.assertEqual(self.receive(payload)[1]["duplicate"], 1)
+
+        key = notifier.make_comment_key(1, 7, 10, {"id": 42})
+        self.assertEqual(self.sent, [key])
+        state, _ = notifier.load_state(self.state_file)
+        self.assertIn(key, state["seen"])
+
+    def test_unresolved_without_mirror_and_resolved_with_mirror(self):
+        payload = push_receiver.build_live_event(1, 500, 42, 10, "Hi")
+        self.assertEqual(self.receive(payload)[1]["unresolved"], 1)
+
+        mirror_file = str(Path(self.temp_dir.name) / "mirror.sqlite3")
+        conn = mirror.connect_mirror(mirror_file)
+        with conn:
+            conn.execute("INSERT INTO submissions (assignment_id, user_id, id, user_name) VALUES (7, 10, 500, 'Student A')")
+            conn.execute("INSERT INTO assignments (id, course_id, name, due_at) VALUES (7, 1, 'Report', '2026-02-02T23:59:00Z')")
+        conn.close()
+
+        self.receiver = self.make_receiver(lookup=push_receiver.MirrorLookup(mirror_file))
+        self.assertEqual(self.receive(payload)[1]["queued"], 1)
+        event = self.receiver._inbox.get_nowait()
+        self.assertEqual(event["assignment_name"], "Report")
+        self.assertEqual(event["author_name"], "Student A")
+        self.assertEqual(event["key"], notifier.make_comment_key(1, 7, 10, {"id": 42}))
+
+    def test_missing_mirror_and_unresolved_without_reconciliation_are_errors(self):
+        mirror_file = Path(self.temp_dir.name) / "typo.sqlite3"
+        with self.assertRaises(FileNotFoundError):
+            push_receiver.MirrorLookup(str(mirror_file))
+        self.assertFalse(mirror_file.exists())
+
+        self.receiver = self.make_receiver(reconcile=False)
+        status, outcome = self.receive(push_receiver.build_live_event(1, 500, 42, 10, "Hi"))
+        self.assertEqual((status, outcome["unresolved"]), (422, 1))
+        status, _ = self.receive(push_receiver.build_live_event(1, 500, 43, 10, "Hi", assignment_id=7, submission_user_id=10))
+        self.assertEqual(status, 202)
+
+    def test_reconciliation_skips_comments_already_pushed(self):
+        pushed = push_receiver.build_live_event(1, 500, 42, 10, "Hi", assignment_id=7, submission_user_id=10)
+        self.receive(pushed)
+        self.receiver.deliver_pending(timeout=1)
+
+        submission = SimpleNamespace(
+            user_id=10,
+            submission_comments=[
+                {"id": 42, "author_id": 10, "author_name": "Student A", "created_at": "2026-02-01T10:00:00Z", "comment": "Hi"},
+                {"id": 43, "author_id": 10, "author_name": "Student A", "created_at": "2026-02-01T11:00:00Z", "comment": "Missed"},
+            ],
+        )
+        assignment = SimpleNamespace(id=7, name="Report", html_url=None, published=True, has_submitted_submissions=True)
+        assignment.get_submissions = lambda **kwargs: [submission]
+        course = SimpleNamespace(id=1, name="Algorithms", get_assignments=lambda **kwargs: [assignment])
+
+        self.assertEqual(self.receiver.reconcile(course, full_sweep_hours=168, dormant_days=14), 1)
+        self.receiver.deliver_pending(timeout=1)
+        self.assertEqual(self.sent[-1], notifier.make_comment_key(1, 7, 10, {"id": 43}))
+        self.assertEqual(len(self.sent), 2)
+
+    def test_http_round_trip_with_stand_in_producer(self):
+        server = push_receiver.make_server(self.receiver, "127.0.0.1", 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            url = f"http://127.0.0.1:{server.server_port}{push_receiver.DEFAULT_PATH}"
+            payload = push_receiver.build_live_event(1, 500, 42, 10, "Hi", assignment_id=7, submission_user_id=10)
+            status, response = push_receiver.post_event(url, SECRET, payload)
+            self.assertEqual((status, response["queued"]), (202, 1))
+            status, response = push_receiver.post_event(url, "wrong", payload)
+            self.assertEqual(status, 401)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main()